@@ -13,6 +13,7 @@ setuptools.setup(
     ],
     description="Parsing library for SSBM replay files",
     install_requires=['py-ubjson', 'termcolor'],
+    extras_require={'columnar': ['numpy']},
     long_description=long_description,
     long_description_content_type="text/x-rst",
     name="py-slippi",
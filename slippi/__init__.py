@@ -1,5 +1,8 @@
 from .game import Game
-from .parse import parse
+from .index import FrameIndex, IndexedGame
+from .parse import Follow, ParseStats, Peek, StopParsing, iter_events, iter_frames, parse, peek, peek_dir
+from .relay import Overflow, Relay, Subscription
+from .stream import Reconnect, ReplayServer, iter_stream, parse_stream
 from .stats.combo_compter import ComboComputer
 from .stats.stats_computer import StatsComputer
 from .enums import *
@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import functools, os, struct
+from array import array
+from typing import BinaryIO, Optional, Tuple, Union
+
+import numpy as np
+
+from .event import FIRST_FRAME_INDEX, End, Frame, Start
+from .metadata import Metadata
+from .parse import (_FRAME_END, _FRAME_EVENTS, _FRAME_ID, _FRAME_POST, _FRAME_PRE, _FRAME_START, _GAME_END,
+                    _GAME_START, _ITEM, _PORT_ID, ParseError, ParseEvent, _parse_input)
+from .util import *
+
+
+# Record layouts, with fields in payload order (see the `_fields` of the corresponding event classes).
+# Fields that a replay's version doesn't have are zero.
+
+PRE_DTYPE = np.dtype([
+    ('random_seed', 'u4'), ('state', 'u2'), ('position_x', 'f4'), ('position_y', 'f4'), ('facing_direction', 'f4'),
+    ('joystick_x', 'f4'), ('joystick_y', 'f4'), ('cstick_x', 'f4'), ('cstick_y', 'f4'), ('trigger_logical', 'f4'),
+    ('buttons_logical', 'u4'), ('buttons_physical', 'u2'), ('trigger_physical_l', 'f4'), ('trigger_physical_r', 'f4'),
+    ('raw_analog_x', 'u1'), # v1.2.0
+    ('percent', 'f4')]) # v1.4.0
+
+_POST_RAW_FIELDS = [
+    ('character', 'u1'), ('state', 'u2'), ('position_x', 'f4'), ('position_y', 'f4'), ('facing_direction', 'f4'),
+    ('percent', 'f4'), ('shield_size', 'f4'), ('most_recent_hit', 'u1'), ('combo_count', 'u1'), ('last_hit_by', 'u1'),
+    ('stocks_remaining', 'u1'),
+    ('state_age', 'f4'), # v0.2.0
+    ('flags_0', 'u1'), ('flags_1', 'u1'), ('flags_2', 'u1'), ('flags_3', 'u1'), ('flags_4', 'u1'), # v2.0.0
+    ('misc_as', 'f4'), ('is_airborne', '?'), ('last_ground_id', 'u2'), ('jumps_remaining', 'u1'), ('l_cancel', 'u1'),
+    ('hurtbox_status', 'u1'), # v2.1.0
+    ('self_air_x', 'f4'), ('self_y', 'f4'), ('knockback_x', 'f4'), ('knockback_y', 'f4'), ('self_ground_x', 'f4'), # v3.5.0
+    ('hitlag_remaining', 'f4'), # v3.8.0
+    ('animation_index', 'u4')] # v3.11.0
+
+_POST_RAW_DTYPE = np.dtype(_POST_RAW_FIELDS)
+
+#: Post-frame record layout. Same as the payload, except the five state flag bytes are combined into one
+#: :py:class:`slippi.event.StateFlags` bitmask, and `misc_as` is the raw hitstun value (only meaningful when the `HIT_STUN` flag is set).
+POST_DTYPE = np.dtype([(name, t) for (name, t) in _POST_RAW_FIELDS if not name.startswith('flags_')] + [('flags', 'u8')])
+
+_ITEM_RAW_DTYPE = np.dtype([
+    ('type', 'u2'), ('state', 'u1'), ('direction', 'f4'), ('velocity_x', 'f4'), ('velocity_y', 'f4'),
+    ('position_x', 'f4'), ('position_y', 'f4'), ('damage', 'u2'), ('timer', 'f4'), ('spawn_id', 'u4'),
+    ('missile_type', 'u1'), ('turnip_type', 'u1'), ('is_shot_launched', 'u1'), ('charge_power', 'u1'), ('owner', 'i1')]) # v3.6.0
+
+#: Item record layout: the item payload, preceded by the index of the frame it belongs to.
+ITEM_DTYPE = np.dtype([('frame', 'i4')] + _ITEM_RAW_DTYPE.descr)
+
+#: Per-frame record layout.
+FRAME_DTYPE = np.dtype([('index', 'i4'), ('random_seed', 'u4')])
+
+
+def _layout(event_class, offset, size):
+    """Like `versioned_struct`, but padding missing fields with zeros instead of `None`s."""
+    (fields, pad) = versioned_struct(offset, event_class._fields, size or 0)
+    return (fields.unpack_from, (0,) * len(pad))
+
+
+def _column(rows, count, dtype):
+    """Scatter `rows` (frame number -> tuple of field values) into an array with one row per frame."""
+    out = np.zeros(count, dtype)
+    if rows:
+        idx = np.fromiter(rows.keys(), np.int32, len(rows)) - FIRST_FRAME_INDEX
+        out[idx] = np.array(list(rows.values()), dtype)
+    return out
+
+
+def _mask(pre, post, count):
+    """True for frames that have neither pre- nor post-frame data."""
+    mask = np.ones(count, bool)
+    for rows in (pre, post):
+        if rows:
+            mask[np.fromiter(rows.keys(), np.int32, len(rows)) - FIRST_FRAME_INDEX] = False
+    return mask
+
+
+def _data(pre, post, count):
+    return ColumnarGame.Data(_column(pre, count, PRE_DTYPE), _post_column(_column(post, count, _POST_RAW_DTYPE)),
+                             _mask(pre, post, count))
+
+
+def _post_column(raw):
+    """Convert raw post-frame rows (:py:data:`_POST_RAW_DTYPE`) to :py:data:`POST_DTYPE`, combining the flag bytes."""
+    out = np.zeros(len(raw), POST_DTYPE)
+    for name in POST_DTYPE.names:
+        if name != 'flags':
+            out[name] = raw[name]
+    out['flags'] = sum(raw['flags_%d' % i].astype(np.uint64) << np.uint64(8 * i) for i in range(5))
+    return out
+
+
+# Frame event headers, before the fields in the raw dtypes above
+_PORT_HEADER = (('frame', '>i4', 0), ('port', 'u1', 4), ('is_follower', 'u1', 5))
+_FRAME_HEADER = (('frame', '>i4', 0),)
+
+
+@functools.lru_cache(maxsize=None)
+def _record(header, raw_dtype, size):
+    """Big-endian layout of a whole event payload of the given size: `header` (`(name, type, offset)` triples), then
+    every field of `raw_dtype` that fits. Fields too new for `size` are left out."""
+
+    names = []
+    formats = []
+    offsets = []
+    for (name, t, offset) in header:
+        names.append(name)
+        formats.append(t)
+        offsets.append(offset)
+    start = max(offset + np.dtype(t).itemsize for (_, t, offset) in header)
+    for name in raw_dtype.names:
+        (t, offset) = raw_dtype.fields[name][:2]
+        if start + offset + t.itemsize > size:
+            break
+        names.append(name)
+        formats.append(t.newbyteorder('>'))
+        offsets.append(start + offset)
+    # `size` is zero for event types the replay doesn't have
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': max(size, start)})
+
+
+def _gather(raw, positions, dtype):
+    """Copy the payloads of the events at `positions` (of their event codes) into one array of `dtype` records."""
+    if not len(positions):
+        return np.zeros(0, dtype)
+    rows = raw[positions[:, None] + np.arange(1, 1 + dtype.itemsize)]
+    return rows.view(dtype).reshape(-1)
+
+
+def _last(keys):
+    """Unique values of `keys`, and the index of the last occurrence of each."""
+    (unique, first) = np.unique(keys[::-1], return_index=True)
+    return (unique, len(keys) - 1 - first)
+
+
+def _scatter(records, count, dtype):
+    """Rows of `dtype` (one per frame) filled from `records`. When a frame appears more than once (due to rollback), its last copy wins."""
+    out = np.zeros(count, dtype)
+    (idx, last) = _last(records['frame'] - FIRST_FRAME_INDEX)
+    records = records[last]
+    for name in records.dtype.names:
+        if name in dtype.names:
+            out[name][idx] = records[name]
+    return (out, idx)
+
+
+def _bulk_data(pre, post, count):
+    (pre, pre_idx) = _scatter(pre, count, PRE_DTYPE)
+    (post, post_idx) = _scatter(post, count, _POST_RAW_DTYPE)
+    mask = np.ones(count, bool)
+    mask[pre_idx] = False
+    mask[post_idx] = False
+    return ColumnarGame.Data(pre, _post_column(post), mask)
+
+
+def _bulk_decodable(payload_sizes):
+    """Whether pre- & post-frame payloads hold at least their oldest field group (true of all known replay versions)."""
+    return all(payload_sizes.get(code, 0) >= 6 + struct.calcsize('>' + event_class._fields[0])
+               for (code, event_class) in ((_FRAME_PRE, Frame.Port.Data.Pre), (_FRAME_POST, Frame.Port.Data.Post)))
+
+
+class ColumnarGame(Base):
+    """Replay data from a game of Super Smash Brothers Melee, with frame data decoded into NumPy structured arrays
+    (one row per frame) rather than :py:class:`slippi.event.Frame` objects. Requires numpy.
+
+    Rows are indexed by frame number, like :py:attr:`slippi.game.Game.frames`. As in `Game`, only the last copy of a
+    frame that was re-sent due to rollback is kept.
+
+    By default, frame data is decoded in bulk: a first pass just finds each event, then all of a replay's pre-frame
+    (post-frame, etc.) payloads are copied into a single big-endian record array and converted at once."""
+
+    start: Optional[Start] #: Information about the start of the game
+    frames: np.ndarray #: Frame numbers & start-of-frame random seeds (:py:data:`FRAME_DTYPE`)
+    ports: Tuple[Optional[ColumnarGame.Port], ...] #: Frame data for each port (port 1 is index 0; empty ports will contain None)
+    items: np.ndarray #: Every active item on every frame (:py:data:`ITEM_DTYPE`)
+    end: Optional[End] #: Information about the end of the game
+    metadata: Optional[Metadata] #: Miscellaneous data not directly provided by Melee
+    metadata_raw: Optional[dict] #: Raw JSON metadata, for debugging and forward-compatibility
+
+    def __init__(self, input: Union[BinaryIO, str, os.PathLike], use_mmap: bool = False, bulk: bool = True):
+        """Parse a Slippi replay.
+
+        :param input: replay file object or path
+        :param use_mmap: when true, memory-map the replay file instead of reading it into memory
+        :param bulk: when false (or for replays whose frame payloads are too short for bulk decoding), decode frame data one event at a time"""
+        self.start = None
+        self.frames = np.zeros(0, FRAME_DTYPE)
+        self.ports = (None, None, None, None)
+        self.items = np.zeros(0, ITEM_DTYPE)
+        self.end = None
+        self.metadata = None
+        self.metadata_raw = None
+
+        _parse_input(input, {
+            ParseEvent.START: lambda x: setattr(self, 'start', x),
+            ParseEvent.END: lambda x: setattr(self, 'end', x),
+            ParseEvent.METADATA: lambda x: setattr(self, 'metadata', x),
+            ParseEvent.METADATA_RAW: lambda x: setattr(self, 'metadata_raw', x)},
+            False, functools.partial(self._parse_events, bulk=bulk), use_mmap)
+
+    def _parse_events(self, buf, pos, end, payload_sizes, handlers, base_pos = 0, bulk = True):
+        if bulk and _bulk_decodable(payload_sizes):
+            return self._parse_events_bulk(buf, pos, end, payload_sizes, handlers, base_pos)
+        else:
+            return self._parse_events_each(buf, pos, end, payload_sizes, handlers, base_pos)
+
+    def _parse_events_bulk(self, buf, pos, end, payload_sizes, handlers, base_pos):
+        if not end:
+            end = len(buf)
+            stop_at_end = True
+        else:
+            stop_at_end = False
+
+        # The only per-event work: find where each event starts.
+        positions = array('q')
+        codes = bytearray()
+        while pos < end:
+            code = buf[pos]
+            try: size = payload_sizes[code]
+            except KeyError: raise ParseError('unexpected event type: 0x%02x' % code, pos = base_pos + pos)
+            positions.append(pos)
+            codes.append(code)
+            pos += 1 + size
+            if code == _GAME_END and stop_at_end:
+                break
+
+        positions = np.frombuffer(positions, np.int64)
+        codes = np.frombuffer(bytes(codes), np.uint8)
+        raw = np.frombuffer(buf, np.uint8)
+
+        for (code, event, event_class) in ((_GAME_START, ParseEvent.START, Start), (_GAME_END, ParseEvent.END, End)):
+            handler = handlers.get(event)
+            if handler:
+                for p in positions[codes == code].tolist():
+                    try: parsed = event_class._parse(memoryview(buf)[p + 1:p + 1 + payload_sizes[code]])
+                    except Exception as e: raise ParseError(str(e), pos = base_pos + p) from e
+                    handler(parsed)
+
+        # Frame numbers of all frame events, in order. A change of frame number starts a new "segment": either a new
+        # frame, or a rollback re-send of an earlier one (which replaces it entirely).
+        is_frame_event = np.isin(codes, list(_FRAME_EVENTS))
+        frame_positions = positions[is_frame_event]
+        frame_codes = codes[is_frame_event]
+        frame_numbers = _gather(raw, frame_positions, np.dtype('>i4')).astype(np.int32)
+        count = int(frame_numbers.max()) - FIRST_FRAME_INDEX + 1 if len(frame_numbers) else 0
+        segments = np.cumsum(np.concatenate(([True], frame_numbers[1:] != frame_numbers[:-1])))
+
+        seeds = _gather(raw, frame_positions[frame_codes == _FRAME_START],
+                        _record(_FRAME_HEADER, np.dtype([('random_seed', 'u4')]), payload_sizes.get(_FRAME_START, 0)))
+        (self.frames, _) = _scatter(seeds, count, FRAME_DTYPE)
+        self.frames['index'] = np.arange(FIRST_FRAME_INDEX, FIRST_FRAME_INDEX + count)
+
+        pre = _gather(raw, positions[codes == _FRAME_PRE], _record(_PORT_HEADER, PRE_DTYPE, payload_sizes[_FRAME_PRE]))
+        post = _gather(raw, positions[codes == _FRAME_POST], _record(_PORT_HEADER, _POST_RAW_DTYPE, payload_sizes[_FRAME_POST]))
+        ports = []
+        for i in PORTS:
+            data = []
+            for is_follower in (0, 1):
+                (port_pre, port_post) = (r[(r['port'] == i) & (r['is_follower'] == is_follower)] for r in (pre, post))
+                data.append(_bulk_data(port_pre, port_post, count) if len(port_pre) or len(port_post) else None)
+            ports.append(self.Port(*data) if data[0] else None)
+        self.ports = tuple(ports)
+
+        # only keep items from the last copy of each frame
+        is_item = frame_codes == _ITEM
+        last_segment = np.zeros(count, segments.dtype)
+        (idx, last) = _last(frame_numbers)
+        last_segment[idx - FIRST_FRAME_INDEX] = segments[last]
+        item_frames = frame_numbers[is_item] - FIRST_FRAME_INDEX
+        keep = segments[is_item] == last_segment[item_frames]
+        records = _gather(raw, frame_positions[is_item][keep],
+                          _record(_FRAME_HEADER, _ITEM_RAW_DTYPE, payload_sizes.get(_ITEM, 0)))
+        records = records[np.argsort(item_frames[keep], kind='stable')]
+        self.items = np.zeros(len(records), ITEM_DTYPE)
+        for name in records.dtype.names:
+            self.items[name] = records[name]
+        self.items['frame'] -= FIRST_FRAME_INDEX
+
+        return pos
+
+    def _parse_events_each(self, buf, pos, end, payload_sizes, handlers, base_pos):
+        if not end:
+            end = len(buf)
+            stop_at_end = True
+        else:
+            stop_at_end = False
+
+        (unpack_pre, pre_pad) = _layout(Frame.Port.Data.Pre, 6, payload_sizes.get(_FRAME_PRE))
+        (unpack_post, post_pad) = _layout(Frame.Port.Data.Post, 6, payload_sizes.get(_FRAME_POST))
+        (unpack_item, item_pad) = _layout(Frame.Item, 4, payload_sizes.get(_ITEM))
+        unpack_seed = Frame.Start._struct.unpack_from
+
+        # frame number -> field values, by port & follower flag
+        pre = [({}, {}) for _ in PORTS]
+        post = [({}, {}) for _ in PORTS]
+        items = {} # frame number -> rows
+        seeds = {} # frame number -> random seed
+        current = None
+        last = FIRST_FRAME_INDEX - 1
+
+        while pos < end:
+            code = buf[pos]
+            try:
+                try: size = payload_sizes[code]
+                except KeyError: raise ValueError('unexpected event type: 0x%02x' % code)
+
+                if code == _FRAME_PRE or code == _FRAME_POST:
+                    (frame, port, is_follower) = _PORT_ID.unpack_from(buf, pos + 1)
+                elif code == _ITEM or code == _FRAME_START or code == _FRAME_END:
+                    (frame,) = _FRAME_ID.unpack_from(buf, pos + 1)
+                else:
+                    frame = None
+
+                if frame is not None and frame != current:
+                    # a new frame, or a rollback re-send of an earlier one (which replaces it entirely)
+                    current = frame
+                    items.pop(frame, None)
+                    if frame > last:
+                        last = frame
+
+                if code == _FRAME_PRE:
+                    pre[port][is_follower][frame] = unpack_pre(buf, pos + 7) + pre_pad
+                elif code == _FRAME_POST:
+                    post[port][is_follower][frame] = unpack_post(buf, pos + 7) + post_pad
+                elif code == _ITEM:
+                    items.setdefault(frame, []).append((frame - FIRST_FRAME_INDEX,) + unpack_item(buf, pos + 5) + item_pad)
+                elif code == _FRAME_START:
+                    seeds[frame] = unpack_seed(buf, pos + 5)
+                elif code == _GAME_START:
+                    handler = handlers.get(ParseEvent.START)
+                    if handler:
+                        handler(Start._parse(memoryview(buf)[pos + 1:pos + 1 + size]))
+                elif code == _GAME_END:
+                    handler = handlers.get(ParseEvent.END)
+                    if handler:
+                        handler(End._parse(memoryview(buf)[pos + 1:pos + 1 + size]))
+                    if stop_at_end:
+                        pos += 1 + size
+                        break
+            except Exception as e:
+                raise ParseError(str(e), pos = base_pos + pos) from e
+
+            pos += 1 + size
+
+        count = last - FIRST_FRAME_INDEX + 1
+        self.frames = np.zeros(count, FRAME_DTYPE)
+        self.frames['index'] = np.arange(FIRST_FRAME_INDEX, FIRST_FRAME_INDEX + count)
+        self.frames['random_seed'] = _column({f: s[0] for (f, s) in seeds.items()}, count, 'u4')
+
+        ports = []
+        for i in PORTS:
+            if pre[i][0] or post[i][0]:
+                leader = _data(pre[i][0], post[i][0], count)
+                follower = _data(pre[i][1], post[i][1], count) if pre[i][1] or post[i][1] else None
+                ports.append(self.Port(leader, follower))
+            else:
+                ports.append(None)
+        self.ports = tuple(ports)
+
+        rows = [row for frame in sorted(items) for row in items[frame]]
+        self.items = np.array(rows, ITEM_DTYPE) if rows else np.zeros(0, ITEM_DTYPE)
+
+        return pos
+
+    def _attr_repr(self, attr):
+        self_attr = getattr(self, attr)
+        if isinstance(self_attr, np.ndarray):
+            return '%s=[...](%d)' % (attr, len(self_attr))
+        elif attr == 'metadata_raw':
+            return None
+        else:
+            return super()._attr_repr(attr)
+
+
+    class Port(Base):
+        """Frame data for a given port. Can include two characters' frame data (ICs)."""
+
+        leader: ColumnarGame.Data #: Frame data for the controlled character
+        follower: Optional[ColumnarGame.Data] #: Frame data for the follower (Nana), if any
+
+        def __init__(self, leader: ColumnarGame.Data, follower: Optional[ColumnarGame.Data] = None):
+            self.leader = leader
+            self.follower = follower
+
+
+    class Data(Base):
+        """Frame data for a given character, one row per frame."""
+
+        pre: np.ndarray #: Pre-frame update data (:py:data:`PRE_DTYPE`)
+        post: np.ndarray #: Post-frame update data (:py:data:`POST_DTYPE`)
+        mask: np.ndarray #: True for frames on which the character has no data (e.g. a dead Nana). Those rows are zero.
+
+        def __init__(self, pre: np.ndarray, post: np.ndarray, mask: np.ndarray):
+            self.pre = pre
+            self.post = post
+            self.mask = mask
+
+        def _attr_repr(self, attr):
+            return '%s=[...](%d)' % (attr, len(getattr(self, attr)))
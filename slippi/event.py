@@ -1,7 +1,8 @@
 from __future__ import annotations
+import functools, struct
 from enum import IntFlag
 
-from typing import Optional, Sequence, Tuple, Union, List
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union, List
 
 from .enums import (ActionState,
                     Stage,
@@ -35,6 +36,9 @@ class EventType(IntEnum):
 class Start(Base):
     """Information used to initialize the game such as the game mode, settings, characters & stage."""
 
+    __slots__ = ('is_teams', 'players', 'random_seed', 'slippi', 'stage', 'is_pal', 'is_frozen_ps', 'match_id', 'is_ranked',
+                 'game_number', 'tiebreak_number')
+
     is_teams: bool #: True if this was a teams game
     players: Tuple[Optional[Start.Player]] #: Players in this game by port (port 1 is at index 0; empty ports will contain None)
     random_seed: int #: Random seed before the game start
@@ -65,25 +69,21 @@ class Start(Base):
         self.game_number = game_number
         self.tiebreak_number = tiebreak_number
 
-    @classmethod
-    def _parse(cls, stream):
-        slippi_ = cls.Slippi._parse(stream)
+    # field groups in the order they were added: base, v1.0.0, v1.3.0, v1.5.0, v2.0.0, v3.14.0 (x3)
+    _fields = ('4B8x?5xH80x' + '4B5xB26x' * 4 + '72xL', '8L', '16s' * 4, '?', '?', '283x50s', 'xI', 'I')
 
-        stream.read(8)
-        (is_teams,) = unpack('?', stream)
+    @classmethod
+    def _parse(cls, data):
+        (fields, pad) = versioned_struct(0, cls._fields, len(data))
+        values = fields.unpack_from(data, 0) + pad
 
-        stream.read(5)
-        (stage,) = unpack('H', stream)
+        slippi_ = cls.Slippi(cls.Slippi.Version(*values[0:4]))
+        (is_teams, stage) = values[4:6]
         stage = Stage(stage)
 
-        stream.read(80)
         players = []
         for i in PORTS:
-            (character, type, stocks, costume) = unpack('BBBB', stream)
-
-            stream.read(5)
-            (team,) = unpack('B', stream)
-            stream.read(26)
+            (character, type, stocks, costume, team) = values[6 + 5 * i:11 + 5 * i]
 
             try: type = cls.Player.Type(type)
             except ValueError: type = None
@@ -97,51 +97,29 @@ class Start(Base):
 
             players.append(player)
 
-        stream.read(72)
-        (random_seed,) = unpack('L', stream)
-
-        try: # v1.0.0
-            for i in PORTS:
-                (dash_back, shield_drop) = unpack('LL', stream)
-                dash_back = cls.Player.UCF.DashBack(dash_back)
-                shield_drop = cls.Player.UCF.ShieldDrop(shield_drop)
-                if players[i]:
-                    players[i].ucf = cls.Player.UCF(dash_back, shield_drop)
-        except EOFError: pass
-
-        try: # v1.3.0
-            for i in PORTS:
-                tag_bytes = stream.read(16)
-                if players[i]:
-                    try:
-                        null_pos = tag_bytes.index(0)
-                        tag_bytes = tag_bytes[:null_pos]
-                    except ValueError: pass
-                    players[i].tag = tag_bytes.decode('shift-jis').rstrip()
-        except EOFError: pass
-
-        # v1.5.0
-        try: (is_pal,) = unpack('?', stream)
-        except EOFError: is_pal = None
-
-        # v2.0.0
-        try: (is_frozen_ps,) = unpack('?', stream)
-        except EOFError: is_frozen_ps = None
-
-        # v3.14.0
-        stream.read(283)
-
-        try:
-            (match_id,) = unpack('50s', stream)
-            match_id = str(match_id.decode('utf-8')).rstrip('\x00')
-        except EOFError: match_id = None
-
-        stream.read(1)
-        try: (game_number,) = unpack('I', stream)
-        except EOFError: game_number = None
+        (random_seed, *ucf) = values[26:35]
+        tags = values[35:39]
+        (is_pal, is_frozen_ps, match_id, game_number, tiebreak_number) = values[39:44]
 
-        try: (tiebreak_number,) = unpack('I', stream)
-        except EOFError: tiebreak_number = None
+        for i in PORTS:
+            if not players[i]:
+                continue
+
+            if ucf[0] is not None: # v1.0.0
+                dash_back = cls.Player.UCF.DashBack(ucf[2 * i])
+                shield_drop = cls.Player.UCF.ShieldDrop(ucf[2 * i + 1])
+                players[i].ucf = cls.Player.UCF(dash_back, shield_drop)
+
+            if tags[i] is not None: # v1.3.0
+                tag_bytes = tags[i]
+                try:
+                    null_pos = tag_bytes.index(0)
+                    tag_bytes = tag_bytes[:null_pos]
+                except ValueError: pass
+                players[i].tag = tag_bytes.decode('shift-jis').rstrip()
+
+        if match_id is not None: # v3.14.0
+            match_id = str(match_id.decode('utf-8')).rstrip('\x00')
 
         return cls(
             is_teams=is_teams,
@@ -168,15 +146,13 @@ class Start(Base):
     class Slippi(Base):
         """Information about the Slippi recorder that generated this replay."""
 
+        __slots__ = 'version'
+
         version: Start.Slippi.Version #: Slippi version number
 
         def __init__(self, version: Start.Slippi.Version):
             self.version = version
 
-        @classmethod
-        def _parse(cls, stream):
-            return cls(cls.Version(*unpack('BBBB', stream)))
-
         def __eq__(self, other):
             if isinstance(other, self.__class__):
                 return self.version == other.version
@@ -200,6 +176,7 @@ class Start(Base):
 
 
         class Version(Base):
+            __slots__ = 'major', 'minor', 'revision'
 
             major: int
             minor: int
@@ -255,6 +232,9 @@ class Start(Base):
     class Player(Base):
         """Contains metadata about the player from the console's perspective including:
         character, starting stock count, costume, team, in-game tag, and UCF toggles"""
+
+        __slots__ = 'character', 'type', 'stocks', 'costume', 'team', 'ucf', 'tag'
+
         character: CSSCharacter #: Character selected
         type: Start.Player.Type #: Player type (human/cpu)
         stocks: int #: Starting stock count
@@ -299,6 +279,9 @@ class Start(Base):
 
         class UCF(Base):
             """UCF Dashback and shield drop, off, on, or arduino"""
+
+            __slots__ = 'dash_back', 'shield_drop'
+
             dash_back: Start.Player.UCF.DashBack #: UCF dashback status
             shield_drop: Start.Player.UCF.ShieldDrop #: UCF shield drop status
 
@@ -328,6 +311,8 @@ class Start(Base):
 class End(Base):
     """Information about the end of the game."""
 
+    __slots__ = 'method', 'lras_initiator', 'player_placements'
+
     method: End.Method #: `changed(2.0.0)` How the game ended
     lras_initiator: Optional[int] #: `added(2.0.0)` Index of player that LRAS'd, if any
     # Player placements stored as a list. The index represents the port, the value of that element is their placement.
@@ -338,19 +323,15 @@ class End(Base):
         self.lras_initiator = lras_initiator
         self.player_placements = player_placements
 
+    # field groups in the order they were added: base, v2.0.0, v3.13.0
+    _fields = ('B', 'B', 'bbbb')
+
     @classmethod
-    def _parse(cls, stream):
-        (method,) = unpack('B', stream)
-        try: # v2.0.0
-            (lras,) = unpack('B', stream)
-            lras_initiator = lras if lras < len(PORTS) else None
-        except EOFError:
-            lras_initiator = None
-
-        try: # v3.13.0
-            (p1_placement, p2_placement, p3_placement, p4_placement) = unpack('bbbb', stream)
-            player_placements = [p1_placement, p2_placement, p3_placement, p4_placement]
-        except EOFError:
+    def _parse(cls, data):
+        (fields, pad) = versioned_struct(0, cls._fields, len(data))
+        (method, lras, *player_placements) = fields.unpack_from(data, 0) + pad
+        lras_initiator = lras if lras is not None and lras < len(PORTS) else None
+        if player_placements[0] is None:
             player_placements = None
         return cls(cls.Method(method), lras_initiator, player_placements)
 
@@ -399,33 +380,37 @@ class Frame(Base):
         leader: Frame.Port.Data #: Frame data for the controlled character
         follower: Optional[Frame.Port.Data] #: Frame data for the follower (Nana), if any
 
-        def __init__(self):
-            self.leader = self.Data()
+        def __init__(self, source: Optional[_ReplayBuffer] = None):
+            self.leader = self.Data(source)
             self.follower = None
 
 
         class Data(Base):
             """Frame data for a given character. Includes both pre-frame and post-frame data."""
 
-            __slots__ = '_pre', '_post'
+            # Until first accessed, `_pre` & `_post` are just the offsets of their payloads in `_source`
+            __slots__ = '_source', '_pre', '_post'
 
-            def __init__(self):
+            def __init__(self, source: Optional[_ReplayBuffer] = None):
+                self._source = source
                 self._pre = None
                 self._post = None
 
             @property
             def pre(self) -> Optional[Frame.Port.Data.Pre]:
                 """Pre-frame update data"""
-                if self._pre and not isinstance(self._pre, self.Pre):
-                    self._pre = self.Pre._parse(self._pre)
-                return self._pre
+                pre = self._pre
+                if pre.__class__ is int:
+                    pre = self._pre = self._source.parse_pre(self._source.buf, pre)
+                return pre
 
             @property
             def post(self) -> Optional[Frame.Port.Data.Post]:
                 """Post-frame update data"""
-                if self._post and not isinstance(self._post, self.Post):
-                    self._post = self.Post._parse(self._post)
-                return self._post
+                post = self._post
+                if post.__class__ is int:
+                    post = self._post = self._source.parse_post(self._source.buf, post)
+                return post
 
 
             class Pre(Base):
@@ -460,31 +445,57 @@ class Frame(Base):
                     self.raw_analog_x = raw_analog_x #: int | None: `added(1.2.0)` Raw x analog controller input (for UCF)
                     self.percent = damage #: float | None: `added(1.4.0)` Current damage percent
 
+                # field groups in the order they were added: base, v1.2.0, v1.4.0
+                _fields = ('LHffffffffLHff', 'B', 'f')
+
+                # indices (into `_fields`) of the payload fields each attribute is built from, and how to build it
+                _attributes = {
+                    'state': ((1,), lambda state: _ACTION_STATES.get(state, state)),
+                    'position': ((2, 3), lambda x, y: Position(x, y)),
+                    'facing_direction': ((4,), lambda direction: _DIRECTIONS.get(direction, direction)),
+                    'joystick': ((5, 6), lambda x, y: _stick(x, y)),
+                    'cstick': ((7, 8), lambda x, y: _stick(x, y)),
+                    'triggers': ((9, 12, 13), lambda logical, l, r: _triggers(logical, l, r)),
+                    'buttons': ((10, 11), lambda logical, physical: _buttons(logical, physical)),
+                    'random_seed': ((0,), None),
+                    'raw_analog_x': ((14,), None),
+                    'percent': ((15,), None)}
+
+                @classmethod
+                def _parse(cls, data):
+                    return cls._decoder(len(data))(data)
+
                 @classmethod
-                def _parse(cls, stream):
-                    (random_seed, state, position_x, position_y, direction, joystick_x, joystick_y, cstick_x,
-                     cstick_y, trigger_logical, buttons_logical, buttons_physical, trigger_physical_l,
-                     trigger_physical_r) = unpack('LHffffffffLHff', stream)
-
-                    # v1.2.0
-                    try: (raw_analog_x,) = unpack('B', stream)
-                    except EOFError: raw_analog_x = None
-
-                    # v1.4.0
-                    try: (damage,) = unpack('f', stream)
-                    except EOFError: damage = None
-
-                    return cls(
-                        state=try_enum(ActionState, state),
-                        position=Position(position_x, position_y),
-                        direction=Direction(direction),
-                        joystick=Position(joystick_x, joystick_y),
-                        cstick=Position(cstick_x, cstick_y),
-                        triggers=Triggers(trigger_logical, trigger_physical_l, trigger_physical_r),
-                        buttons=Buttons(buttons_logical, buttons_physical),
-                        random_seed=random_seed,
-                        raw_analog_x=raw_analog_x,
-                        damage=damage)
+                @functools.lru_cache(maxsize=None)
+                def _decoder(cls, size):
+                    """Build a decoder for pre-frame payloads of the given size (which depends on the replay version)."""
+                    (fields, pad) = versioned_struct(6, cls._fields, size)
+                    unpack_from = fields.unpack_from
+
+                    def decode(data, pos = 0):
+                        (random_seed, state, position_x, position_y, direction, joystick_x, joystick_y, cstick_x,
+                         cstick_y, trigger_logical, buttons_logical, buttons_physical, trigger_physical_l,
+                         trigger_physical_r, raw_analog_x, damage) = unpack_from(data, pos + 6) + pad
+
+                        return cls(
+                            state=_ACTION_STATES.get(state, state),
+                            position=Position(position_x, position_y),
+                            direction=_DIRECTIONS.get(direction, direction),
+                            joystick=_stick(joystick_x, joystick_y),
+                            cstick=_stick(cstick_x, cstick_y),
+                            triggers=_triggers(trigger_logical, trigger_physical_l, trigger_physical_r),
+                            buttons=_buttons(buttons_logical, buttons_physical),
+                            random_seed=random_seed,
+                            raw_analog_x=raw_analog_x,
+                            damage=damage)
+
+                    return decode
+
+                @classmethod
+                @functools.lru_cache(maxsize=None)
+                def _projection(cls, size, attributes):
+                    """Build a decoder for pre-frame payloads of the given size that only sets `attributes`."""
+                    return _projected_decoder(cls, 6, size, attributes)
 
 
             class Post(Base):
@@ -557,83 +568,109 @@ class Frame(Base):
                     self.hitlag_remaining = hitlag_remaining
                     self.animation_index = animation_index
 
+                # field groups in the order they were added: base, v0.2.0, v2.0.0, v2.1.0, v3.5.0, v3.8.0, v3.11.0
+                _fields = ('BHfffffBBBB', 'f', '5Bf?HBB', 'B', 'fffff', 'f', 'I')
+
+                # indices (into `_fields`) of the payload fields each attribute is built from, and how to build it
+                _attributes = {
+                    'character': ((0,), lambda character: _IN_GAME_CHARACTERS.get(character, character)),
+                    'state': ((1,), lambda state: _ACTION_STATES.get(state, state)),
+                    'position': ((2, 3), lambda x, y: Position(x, y)),
+                    'facing_direction': ((4,), lambda direction: _DIRECTIONS.get(direction, direction)),
+                    'percent': ((5,), None),
+                    'shield_size': ((6,), None),
+                    'most_recent_hit': ((7,), lambda attack: _ATTACKS.get(attack, attack)),
+                    'combo_count': ((8,), None),
+                    'last_hit_by': ((9,), lambda port: port if port < 4 else None),
+                    'stocks_remaining': ((10,), None),
+                    'state_age': ((11,), None),
+                    'flags': ((12, 13, 14, 15, 16), lambda *flags: StateFlags(int.from_bytes(bytes(flags), 'little'))),
+                    'maybe_hitstun_remaining': ((17,), None),
+                    'is_airborne': ((18,), None),
+                    'last_ground_id': ((19,), None),
+                    'jumps_remaining': ((20,), None),
+                    'l_cancel': ((21,), lambda l_cancel: _L_CANCELS.get(l_cancel, l_cancel) if l_cancel else None),
+                    'hurtbox_status': ((22,), lambda hurtbox: _HURTBOXES.get(hurtbox, hurtbox)),
+                    'self_ground_speed': ((27, 24), lambda x, y: Velocity(x, y)),
+                    'self_air_speed': ((23, 24), lambda x, y: Velocity(x, y)),
+                    'knockback_speed': ((25, 26), lambda x, y: Velocity(x, y)),
+                    'hitlag_remaining': ((28,), None),
+                    'animation_index': ((29,), None)}
+
                 @classmethod
-                def _parse(cls, stream):
-                    (character, state, position_x, position_y, direction, damage, shield, last_attack_landed,
-                     combo_count, last_hit_by, stocks) = unpack('BHfffffBBBB', stream)
-
-                    # v0.2.0
-                    try: (state_age,) = unpack('f', stream)
-                    except EOFError: state_age = None
-                    
-                    try: # v2.0.0
-                        flags = unpack('5B', stream)
-                        (misc_as, airborne, maybe_ground, jumps, l_cancel) = unpack('f?HBB', stream)
-                        log.info('%s', flags)
-                        flags = StateFlags(flags[0] +
-                                           flags[1] * 2**8 +
-                                           flags[2] * 2**16 +
-                                           flags[3] * 2**24 +
-                                           flags[4] * 2**32)
-                        ground = maybe_ground
-                        hit_stun = misc_as if flags.HIT_STUN else None
-                        l_cancel = LCancel(l_cancel) if l_cancel else None
-                    except EOFError:
-                        (flags, hit_stun, airborne, ground, jumps, l_cancel) = [None] * 6
-
-                    try: # v2.1.0
-                        (hurtbox_status,) = unpack('B', stream)
-                    except EOFError:
-                        hurtbox_status = None
-
-                    try: # v3.5.0
-                        (self_air_x, self_y, kb_x, kb_y, self_ground_x) = unpack('fffff', stream)
-                        self_ground_speed = Velocity(self_ground_x, self_y)
-                        self_air_speed = Velocity(self_air_x, self_y)
-                        knockback_speed = Velocity(kb_x, kb_y)
-                    except EOFError:
-                        (self_ground_speed, self_air_speed, knockback_speed) = [None] * 3
-
-                    try: # v3.8.0
-                        (hitlag_remaining,) = unpack('f', stream)
-                    except EOFError:
-                        hitlag_remaining = None
-
-                    try: # v3.11.0
-                        (animation_index,) = unpack('I', stream)
-                    except EOFError:
-                        animation_index = None
-
-                    return cls(
-                        character=InGameCharacter(character),
-                        state=try_enum(ActionState, state),
-                        state_age=state_age,
-                        position=Position(position_x, position_y),
-                        direction=Direction(direction),
-                        damage=damage,
-                        shield=shield,
-                        stocks=stocks,
-                        most_recent_hit=try_enum(Attack, last_attack_landed),
-                        last_hit_by=last_hit_by if last_hit_by < 4 else None,
-                        combo_count=combo_count,
-                        flags=flags,
-                        hit_stun=hit_stun,
-                        airborne=airborne,
-                        ground=ground,
-                        jumps=jumps,
-                        l_cancel=l_cancel,
-                        hurtbox_status=hurtbox_status,
-                        self_ground_speed=self_ground_speed,
-                        self_air_speed=self_air_speed,
-                        knockback_speed=knockback_speed,
-                        hitlag_remaining=hitlag_remaining,
-                        animation_index=animation_index)
+                def _parse(cls, data):
+                    return cls._decoder(len(data))(data)
+
+                @classmethod
+                @functools.lru_cache(maxsize=None)
+                def _decoder(cls, size):
+                    """Build a decoder for post-frame payloads of the given size (which depends on the replay version)."""
+                    (fields, pad) = versioned_struct(6, cls._fields, size)
+                    unpack_from = fields.unpack_from
+
+                    def decode(data, pos = 0):
+                        (character, state, position_x, position_y, direction, damage, shield, last_attack_landed,
+                         combo_count, last_hit_by, stocks, state_age, flags_0, flags_1, flags_2, flags_3, flags_4,
+                         misc_as, airborne, ground, jumps, l_cancel, hurtbox_status, self_air_x, self_y, kb_x, kb_y,
+                         self_ground_x, hitlag_remaining, animation_index) = unpack_from(data, pos + 6) + pad
+
+                        if flags_0 is not None: # v2.0.0
+                            flags = StateFlags(flags_0 +
+                                               flags_1 * 2**8 +
+                                               flags_2 * 2**16 +
+                                               flags_3 * 2**24 +
+                                               flags_4 * 2**32)
+                            hit_stun = misc_as if flags.HIT_STUN else None
+                            l_cancel = _L_CANCELS.get(l_cancel, l_cancel) if l_cancel else None
+                        else:
+                            flags = hit_stun = None
+
+                        if self_y is not None: # v3.5.0
+                            self_ground_speed = Velocity(self_ground_x, self_y)
+                            self_air_speed = Velocity(self_air_x, self_y)
+                            knockback_speed = Velocity(kb_x, kb_y)
+                        else:
+                            self_ground_speed = self_air_speed = knockback_speed = None
+
+                        return cls(
+                            character=_IN_GAME_CHARACTERS.get(character, character),
+                            state=_ACTION_STATES.get(state, state),
+                            state_age=state_age,
+                            position=Position(position_x, position_y),
+                            direction=_DIRECTIONS.get(direction, direction),
+                            damage=damage,
+                            shield=shield,
+                            stocks=stocks,
+                            most_recent_hit=_ATTACKS.get(last_attack_landed, last_attack_landed),
+                            last_hit_by=last_hit_by if last_hit_by < 4 else None,
+                            combo_count=combo_count,
+                            flags=flags,
+                            hit_stun=hit_stun,
+                            airborne=airborne,
+                            ground=ground,
+                            jumps=jumps,
+                            l_cancel=l_cancel,
+                            hurtbox_status=_HURTBOXES.get(hurtbox_status, hurtbox_status),
+                            self_ground_speed=self_ground_speed,
+                            self_air_speed=self_air_speed,
+                            knockback_speed=knockback_speed,
+                            hitlag_remaining=hitlag_remaining,
+                            animation_index=animation_index)
+
+                    return decode
+
+                @classmethod
+                @functools.lru_cache(maxsize=None)
+                def _projection(cls, size, attributes):
+                    """Build a decoder for post-frame payloads of the given size that only sets `attributes`."""
+                    return _projected_decoder(cls, 6, size, attributes)
 
 
     class Item(Base):
         """An active item (includes projectiles)."""
 
-        __slots__ = 'type', 'state', 'direction', 'velocity', 'position', 'damage', 'timer', 'spawn_id'
+        __slots__ = ('type', 'state', 'direction', 'velocity', 'position', 'damage', 'timer', 'spawn_id', 'missile_type',
+                     'turnip_type', 'is_shot_launched', 'charge_power', 'owner')
 
         type: Item #: Item type
         state: int #: Item's action state
@@ -667,33 +704,40 @@ class Frame(Base):
             self.charge_power = charge_power
             self.owner = owner
 
+        # field groups in the order they were added: base (v3.0.0), v3.6.0
+        _fields = ('HB5fHfI', '4Bb')
+
+        @classmethod
+        def _parse(cls, data):
+            return cls._decoder(len(data))(data)
+
         @classmethod
-        def _parse(cls, stream):
-            (type, state, direction, x_vel, y_vel, x_pos, y_pos, damage, timer, spawn_id) = unpack('HB5fHfI', stream)
-
-            try:
-                (missile_type, turnip_type, is_shot_launched, charge_power, owner) = unpack('4Bb', stream)
-            except EOFError:
-                missile_type = None
-                turnip_type = None
-                is_shot_launched = None
-                charge_power = None
-                owner = None
-
-            return cls(
-                type=try_enum(Item, type),
-                state=state,
-                direction=Direction(direction) if direction != 0 else None,
-                velocity=Velocity(x_vel, y_vel),
-                position=Position(x_pos, y_pos),
-                damage=damage,
-                timer=timer,
-                spawn_id=spawn_id,
-                missile_type=missile_type,
-                turnip_type=try_enum(TurnipFace, turnip_type),
-                is_shot_launched=is_shot_launched,
-                charge_power=charge_power,
-                owner=owner)
+        @functools.lru_cache(maxsize=None)
+        def _decoder(cls, size):
+            """Build a decoder for item payloads of the given size (which depends on the replay version)."""
+            (fields, pad) = versioned_struct(4, cls._fields, size)
+            unpack_from = fields.unpack_from
+
+            def decode(data):
+                (type, state, direction, x_vel, y_vel, x_pos, y_pos, damage, timer, spawn_id,
+                 missile_type, turnip_type, is_shot_launched, charge_power, owner) = unpack_from(data, 4) + pad
+
+                return cls(
+                    type=_ITEMS.get(type, type),
+                    state=state,
+                    direction=_DIRECTIONS.get(direction, direction) if direction != 0 else None,
+                    velocity=Velocity(x_vel, y_vel),
+                    position=Position(x_pos, y_pos),
+                    damage=damage,
+                    timer=timer,
+                    spawn_id=spawn_id,
+                    missile_type=missile_type,
+                    turnip_type=_TURNIP_FACES.get(turnip_type, turnip_type),
+                    is_shot_launched=is_shot_launched,
+                    charge_power=charge_power,
+                    owner=owner)
+
+            return decode
 
         def __eq__(self, other):
             if not isinstance(other, self.__class__):
@@ -718,10 +762,11 @@ class Frame(Base):
         def __init__(self, random_seed: int):
             self.random_seed = random_seed
 
+        _struct = struct.Struct('>I')
+
         @classmethod
-        def _parse(cls, stream):
-            (random_seed,) = unpack('I', stream)
-            random_seed = random_seed
+        def _parse(cls, data):
+            (random_seed,) = cls._struct.unpack_from(data, 4)
             return cls(random_seed)
 
         def __eq__(self, other):
@@ -733,11 +778,13 @@ class Frame(Base):
     class End(Base):
         """End-of-frame data."""
 
+        __slots__ = ()
+
         def __init__(self):
             pass
 
         @classmethod
-        def _parse(cls, stream):
+        def _parse(cls, data):
             return cls()
 
         def __eq__(self, other):
@@ -746,48 +793,87 @@ class Frame(Base):
             return True
 
 
-    class Event(Base):
-        """Temporary wrapper used while parsing frame data."""
+class _ReplayBuffer:
+    """A replay's `raw` event data, shared by the :py:class:`Frame.Port.Data` that decode their payloads from it on
+    first access. Payload decoders take the buffer & the payload's offset in it."""
 
-        __slots__ = 'id', 'type', 'data'
+    __slots__ = 'buf', 'pre_size', 'post_size', 'parse_pre', 'parse_post'
+
+    def __init__(self, buf, pre_size, post_size):
+        self.buf = buf
+        self.pre_size = pre_size
+        self.post_size = post_size
+        self.parse_pre = Frame.Port.Data.Pre._decoder(pre_size) if pre_size else None
+        self.parse_post = Frame.Port.Data.Post._decoder(post_size) if post_size else None
+
+    def __reduce__(self):
+        # `buf` may be a view of a memory-mapped file
+        return (self.__class__, (bytes(self.buf), self.pre_size, self.post_size))
 
-        def __init__(self, id, type, data):
-            self.id = id
-            self.type = type
-            self.data = data
 
+def _projected_decoder(cls, offset, size, attributes):
+    """Build a decoder for `cls` payloads that only sets the given attributes (see `cls._attributes`; a `None` builder
+    means the field is used as is), reading just the payload fields they need. Other attributes are left unset, so
+    accessing them raises `AttributeError`."""
 
-        class Id(Base):
-            __slots__ = 'frame'
+    unknown = set(attributes) - cls._attributes.keys()
+    if unknown:
+        raise ValueError(f'unknown {cls.__name__} fields: {", ".join(sorted(unknown))}')
 
-            def __init__(self, stream):
-                (self.frame,) = unpack('i', stream)
+    wanted = sorted({i for attr in attributes for i in cls._attributes[attr][0]})
+    (fields, pad) = projected_struct(offset, cls._fields, size, wanted)
+    unpack_from = fields.unpack_from
+    position = {index: i for (i, index) in enumerate(wanted)}
+    plan = tuple((attr, tuple(position[i] for i in indices), build or (lambda x: x))
+                 for (attr, (indices, build)) in cls._attributes.items() if attr in attributes)
+    new = cls.__new__
 
+    def decode(data, pos = 0):
+        values = unpack_from(data, pos + offset) + pad
+        obj = new(cls)
+        for (attr, indices, build) in plan:
+            # fields are added in groups, so if the first is missing (older replay) they all are
+            setattr(obj, attr, None if values[indices[0]] is None else build(*[values[i] for i in indices]))
+        return obj
 
-        class PortId(Id):
-            __slots__ = 'port', 'is_follower'
+    return decode
 
-            def __init__(self, stream):
-                (self.frame, self.port, self.is_follower) = unpack('iB?', stream)
 
+_setattr = object.__setattr__
 
-        class Type(Enum):
-            START = 'start'
-            END = 'end'
-            PRE = 'pre'
-            POST = 'post'
-            ITEM = 'item'
 
+def _restore(cls, values):
+    obj = object.__new__(cls)
+    for (attr, value) in zip(cls.__slots__, values):
+        _setattr(obj, attr, value)
+    return obj
 
-class Position(Base):
+
+class _Value(Base):
+    """An immutable value object. Decoded controller state is interned (see `_buttons`), so one instance is shared by
+    many frames, across every game parsed; assigning to its attributes raises `AttributeError`."""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"can't set attribute '{name}': {self.__class__.__qualname__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"can't delete attribute '{name}': {self.__class__.__qualname__} is immutable")
+
+    def __reduce__(self):
+        return (_restore, (self.__class__, tuple(getattr(self, attr) for attr in self.__slots__)))
+
+
+class Position(_Value):
     __slots__ = 'x', 'y'
 
     x: float
     y: float
 
     def __init__(self, x: float, y: float):
-        self.x = x
-        self.y = y
+        _setattr(self, 'x', x)
+        _setattr(self, 'y', y)
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
@@ -842,15 +928,15 @@ class Direction(IntEnum):
     DOWN = 0 # not used by slippi replay data, but useful for stats enumerations
     RIGHT = 1
 
-class Triggers(Base):
+class Triggers(_Value):
     __slots__ = 'logical', 'physical'
 
     logical: float #: Processed analog trigger position
     physical: Triggers.Physical #: Physical analog trigger positions (useful for APM)
 
     def __init__(self, logical: float, physical_x: float, physical_y: float):
-        self.logical = logical
-        self.physical = self.Physical(physical_x, physical_y)
+        _setattr(self, 'logical', logical)
+        _setattr(self, 'physical', self.Physical(physical_x, physical_y))
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
@@ -858,15 +944,15 @@ class Triggers(Base):
         return other.logical == self.logical and other.physical == self.physical
 
 
-    class Physical(Base):
+    class Physical(_Value):
         __slots__ = 'l', 'r'
 
         l: float
         r: float
 
         def __init__(self, l: float, r: float):
-            self.l = l
-            self.r = r
+            _setattr(self, 'l', l)
+            _setattr(self, 'r', r)
 
         def __eq__(self, other):
             if not isinstance(other, self.__class__):
@@ -875,15 +961,15 @@ class Triggers(Base):
             return other.l == self.l and other.r == self.r
 
 
-class Buttons(Base):
+class Buttons(_Value):
     __slots__ = 'logical', 'physical'
 
     logical: Buttons.Logical #: Processed button-state bitmask
     physical: Buttons.Physical #: Physical button-state bitmask
 
     def __init__(self, logical, physical):
-        self.logical = self.Logical(logical)
-        self.physical = self.Physical(physical)
+        _setattr(self, 'logical', self.Logical(logical))
+        _setattr(self, 'physical', self.Physical(physical))
 
     def __eq__(self, other):
         if not isinstance(other, Buttons):
@@ -964,3 +1050,22 @@ class Hurtbox(IntEnum):
     VULNERABLE = 0
     INVULNERABLE = 1
     INTANGIBLE = 2
+
+
+# Raw value -> enum member lookups used by the event decoders (see `enum_table`)
+# (annotated, since the decoders defined above refer to them before they're assigned)
+_ACTION_STATES: Dict[int, ActionState] = enum_table(ActionState)
+_ATTACKS: Dict[int, Attack] = enum_table(Attack)
+_ITEMS: Dict[int, Item] = enum_table(Item)
+_TURNIP_FACES: Dict[int, TurnipFace] = enum_table(TurnipFace)
+_IN_GAME_CHARACTERS: Dict[int, InGameCharacter] = enum_table(InGameCharacter)
+_DIRECTIONS: Dict[int, Direction] = enum_table(Direction)
+_L_CANCELS: Dict[int, LCancel] = enum_table(LCancel)
+_HURTBOXES: Dict[int, Hurtbox] = enum_table(Hurtbox)
+
+# Interned pre-frame controller state, shared by every frame that decodes to the same values (which is why these
+# objects are immutable). A game only uses a few hundred distinct button, trigger & stick states, so this saves most
+# allocations.
+_buttons: Callable[[int, int], Buttons] = functools.lru_cache(maxsize=4096)(Buttons)
+_triggers: Callable[[float, float, float], Triggers] = functools.lru_cache(maxsize=4096)(Triggers)
+_stick: Callable[[float, float], Position] = functools.lru_cache(maxsize=4096)(Position)
@@ -1,10 +1,11 @@
 import io, os
+from array import array
 from logging import debug
-from typing import BinaryIO, List, Optional, Union
+from typing import BinaryIO, Collection, List, Optional, Tuple, Union
 
-from .event import FIRST_FRAME_INDEX, End, Frame, Start
+from .event import FIRST_FRAME_INDEX, End, EventType, Frame, Start
 from .metadata import Metadata
-from .parse import ParseEvent, parse
+from .parse import ParseEvent, ParseStats, parse
 from .util import *
 
 
@@ -12,45 +13,90 @@ class Game(Base):
     """Replay data from a game of Super Smash Brothers Melee."""
 
     start: Optional[Start] #: Information about the start of the game
-    frames: List[Frame] #: Every frame of the game, indexed by frame number
+    frames: List[Frame] #: Every frame of the game (or of `frame_range`), in order of frame number
     end: Optional[End] #: Information about the end of the game
     metadata: Optional[Metadata] #: Miscellaneous data not directly provided by Melee
     metadata_raw: Optional[dict] #: Raw JSON metadata, for debugging and forward-compatibility
+    parse_stats: Optional[ParseStats] #: Parse instrumentation, if requested
+    rollbacks: Optional[array] #: `(frame number, start, end)` offsets (within the replay's `raw` element) of each frame copy superseded by rollback, flattened, if requested. :py:meth:`slippi.index.IndexedGame.rollbacks` can decode them.
 
-    def __init__(self, input: Union[BinaryIO, str, os.PathLike], skip_frames: bool = False):
+    def __init__(self, input: Union[BinaryIO, str, os.PathLike], skip_frames: bool = False, use_mmap: bool = False,
+                 event_types: Optional[Collection[EventType]] = None, ports: Optional[Collection[int]] = None,
+                 followers: bool = True, pre_fields: Optional[Collection[str]] = None,
+                 post_fields: Optional[Collection[str]] = None, parse_stats: Optional[ParseStats] = None,
+                 frame_range: Optional[Tuple[Optional[int], Optional[int]]] = None, skip_rollbacks: bool = False,
+                 rollback_history: bool = False):
         """Parse a Slippi replay.
 
-        :param input: replay file object or path"""
+        :param input: replay file object or path
+        :param skip_frames: when true, skip past all frame data
+        :param use_mmap: when true, memory-map the replay file instead of reading it into memory (see :py:func:`slippi.parse.parse`)
+        :param event_types: types of events to decode, e.g. `{EventType.GAME_START, EventType.FRAME_POST}` (see :py:func:`slippi.parse.parse`)
+        :param ports: ports whose frame data to decode (port 1 is 0); frames will contain None for other ports
+        :param followers: when false, skip frame data for followers (Nana)
+        :param pre_fields: pre-frame attributes to decode, e.g. `{'state', 'buttons'}`; others will be unset (see :py:func:`slippi.parse.parse`)
+        :param post_fields: post-frame attributes to decode, e.g. `{'state', 'percent'}`; others will be unset
+        :param parse_stats: if given, add this replay's event counts & parse timings (including rollbacks) to it. Pass the same object for each replay in a batch to aggregate them.
+        :param frame_range: `(first, last)` frame numbers (inclusive; either may be None) of the frames to parse, e.g. `(None, 3600)` for the first minute. `frames[0]` is then frame `first`. Start, end & metadata are still parsed (see :py:func:`slippi.parse.parse`).
+        :param skip_rollbacks: when true, scan frame numbers first and only decode the last copy of each frame, instead of replacing superseded copies as they're re-sent. Faster for netplay replays with a lot of rollback.
+        :param rollback_history: when true, keep the offsets of superseded frame copies in :py:attr:`rollbacks`. Implies `skip_rollbacks`."""
         self.start = None
         self.frames = []
         self.end = None
         self.metadata = None
         self.metadata_raw = None
+        self.parse_stats = parse_stats
+        self.rollbacks = None
+        self._first_index = FIRST_FRAME_INDEX if frame_range is None or frame_range[0] is None \
+            else max(frame_range[0], FIRST_FRAME_INDEX)
 
-        parse(input, {
+        handlers = {
             ParseEvent.START: lambda x: setattr(self, 'start', x),
-            ParseEvent.FRAME: self._add_frame,
+            ParseEvent.FRAME_BATCH: self._add_frames,
             ParseEvent.END: lambda x: setattr(self, 'end', x),
             ParseEvent.METADATA: lambda x: setattr(self, 'metadata', x),
-            ParseEvent.METADATA_RAW: lambda x: setattr(self, 'metadata_raw', x)},
-            skip_frames)
+            ParseEvent.METADATA_RAW: lambda x: setattr(self, 'metadata_raw', x)}
+        if rollback_history or (skip_rollbacks and parse_stats is not None):
+            handlers[ParseEvent.ROLLBACKS] = self._set_rollbacks
+
+        self._rollback_history = rollback_history
+        parse(input, handlers, skip_frames, use_mmap, event_types, ports, followers, pre_fields, post_fields, parse_stats,
+              frame_range=frame_range, skip_rollbacks=skip_rollbacks or rollback_history)
+
+    def _set_rollbacks(self, rollbacks):
+        if self.parse_stats is not None:
+            self.parse_stats.rollbacks += len(rollbacks) // 3
+        if self._rollback_history:
+            self.rollbacks = rollbacks
+
+    def _add_frames(self, frames):
+        # A batch whose frame numbers just count up (no rollback, no gap) is the next run of frames. Checking the ends
+        # isn't enough: a rollback and a gap in the same batch cancel out.
+        first = frames[0].index
+        if first - self._first_index == len(self.frames) and all(f.index == first + i for (i, f) in enumerate(frames)):
+            self.frames.extend(frames)
+        else:
+            for f in frames:
+                self._add_frame(f)
 
     def _add_frame(self, f):
-        idx = f.index - FIRST_FRAME_INDEX
+        idx = f.index - self._first_index
         count = len(self.frames)
         if idx == count:
             self.frames.append(f)
         elif idx < count: # rollback
-            debug(f"rollback: {count-1} -> {idx}")
+            debug('rollback: %d -> %d', count - 1, idx)
+            if self.parse_stats is not None:
+                self.parse_stats.rollbacks += 1
             self.frames[idx] = f
         else:
             raise Exception(f'missing frames: {count-1} -> {idx}')
 
     def _attr_repr(self, attr):
         self_attr = getattr(self, attr)
-        if isinstance(self_attr, list):
+        if isinstance(self_attr, (list, array)):
             return '%s=[...](%d)' % (attr, len(self_attr))
-        elif attr == 'metadata_raw':
+        elif attr == 'metadata_raw' or (attr in ('parse_stats', 'rollbacks') and self_attr is None):
             return None
         else:
             return super()._attr_repr(attr)
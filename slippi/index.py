@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import mmap, os, struct
+from array import array
+from typing import List, Optional, Union
+
+from .event import FIRST_FRAME_INDEX, End, Frame, Start
+from .metadata import Metadata
+from .parse import (_GAME_START, _RAW_START, ParseEvent, _game_end, _parse_event_payloads, _parse_events, _parse_input,
+                    _scan_frames)
+from .util import *
+
+
+#: Suffix appended to a replay's path to get the path of its saved index
+INDEX_SUFFIX = '.idx'
+
+_HEADER = struct.Struct('>8sqqq')
+_MAGIC = b'SLPIDX\x00\x01'
+
+
+class FrameIndex(Base):
+    """Byte offsets of each frame's events within a replay, for random access to its frames.
+
+    Offsets are relative to the start of the replay's `raw` element. Building an index only reads each event's code and
+    frame number, so it's much cheaper than parsing the replay."""
+
+    replay_size: int #: Size of the indexed replay file, used to detect stale saved indexes
+    frames: array #: `(start, end)` offsets of each frame's events, flattened. Frames are ordered as in :py:attr:`slippi.game.Game.frames`.
+    rollbacks: array #: `(frame number, start, end)` of each superseded copy of a frame (due to rollback), flattened
+
+    def __init__(self, replay_size: int, frames: array, rollbacks: array):
+        self.replay_size = replay_size
+        self.frames = frames
+        self.rollbacks = rollbacks
+
+    def __len__(self):
+        return len(self.frames) // 2
+
+    @classmethod
+    def _build(cls, buf, replay_size):
+        (length,) = struct.unpack_from('>l', buf, _RAW_START - 4)
+        raw = memoryview(buf)[_RAW_START:_RAW_START + length] if length else memoryview(buf)[_RAW_START:]
+        try:
+            (bytes_read, payload_sizes) = _parse_event_payloads(raw)
+            (frames, rollbacks) = _scan_frames(raw, bytes_read, length, payload_sizes, _RAW_START)
+        finally:
+            raw.release()
+        return cls(replay_size, frames, rollbacks)
+
+    @classmethod
+    def build(cls, path: Union[str, os.PathLike]) -> FrameIndex:
+        """Index a replay file.
+
+        :param path: replay path"""
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return cls._build(m, len(m))
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> FrameIndex:
+        """Load an index saved by :py:meth:`save`.
+
+        :param path: index path"""
+        with open(path, 'rb') as f:
+            (magic, replay_size, frame_count, rollback_count) = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f'not a frame index: {path}')
+            frames = array('q', struct.unpack('>%dq' % (2 * frame_count), f.read(16 * frame_count)))
+            rollbacks = array('q', struct.unpack('>%dq' % (3 * rollback_count), f.read(24 * rollback_count)))
+        return cls(replay_size, frames, rollbacks)
+
+    def save(self, path: Union[str, os.PathLike]) -> None:
+        """Save this index, typically next to its replay (see :py:data:`INDEX_SUFFIX`).
+
+        :param path: index path"""
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.replay_size, len(self), len(self.rollbacks) // 3))
+            f.write(struct.pack('>%dq' % len(self.frames), *self.frames))
+            f.write(struct.pack('>%dq' % len(self.rollbacks), *self.rollbacks))
+
+    def _attr_repr(self, attr):
+        self_attr = getattr(self, attr)
+        if isinstance(self_attr, array):
+            return '%s=[...](%d)' % (attr, len(self_attr))
+        else:
+            return super()._attr_repr(attr)
+
+
+class IndexedGame(Base):
+    """Replay data from a game of Super Smash Brothers Melee, with random access to its frames.
+
+    Unlike :py:class:`slippi.game.Game`, frames are only parsed on request: the replay is memory-mapped, and a
+    :py:class:`FrameIndex` gives the location of any frame's events."""
+
+    start: Optional[Start] #: Information about the start of the game
+    end: Optional[End] #: Information about the end of the game
+    metadata: Optional[Metadata] #: Miscellaneous data not directly provided by Melee
+    metadata_raw: Optional[dict] #: Raw JSON metadata, for debugging and forward-compatibility
+    index: FrameIndex #: Locations of each frame's events
+
+    def __init__(self, path: Union[str, os.PathLike], index: Optional[FrameIndex] = None, save_index: bool = False):
+        """Open a Slippi replay.
+
+        :param path: replay path
+        :param index: frame index for this replay. By default, the index saved next to the replay is used if it's up to date, otherwise a new one is built.
+        :param save_index: when true, save a newly-built index next to the replay"""
+        self.start = None
+        self.end = None
+        self.metadata = None
+        self.metadata_raw = None
+
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_path = str(path) + INDEX_SUFFIX
+        if index is None and os.path.exists(index_path):
+            index = FrameIndex.load(index_path)
+            if index.replay_size != len(self._buf):
+                index = None
+        if index is None:
+            index = FrameIndex._build(self._buf, len(self._buf))
+            if save_index:
+                index.save(index_path)
+        self.index = index
+
+        (self._length,) = struct.unpack_from('>l', self._buf, _RAW_START - 4)
+        (bytes_read, self._payload_sizes) = _parse_event_payloads(self._buf, _RAW_START)
+
+        if self._length:
+            _parse_input(self._buf, {
+                ParseEvent.START: lambda x: setattr(self, 'start', x),
+                ParseEvent.END: lambda x: setattr(self, 'end', x),
+                ParseEvent.METADATA: lambda x: setattr(self, 'metadata', x),
+                ParseEvent.METADATA_RAW: lambda x: setattr(self, 'metadata_raw', x)},
+                True, _parse_events, False)
+        else:
+            self._parse_in_progress(_RAW_START + bytes_read)
+
+    def _parse_in_progress(self, pos):
+        """Find the start & (if it's been written) end of a replay that's still being written. Without a length, the
+        `skip_frames` path can't locate the end, so look for it after the last indexed frame instead. There's no
+        metadata yet."""
+
+        (buf, sizes) = (self._buf, self._payload_sizes)
+        if pos < len(buf) and buf[pos] == _GAME_START and pos + 1 + sizes[_GAME_START] <= len(buf):
+            self.start = Start._parse(memoryview(buf)[pos + 1:pos + 1 + sizes[_GAME_START]])
+
+        if len(self.index):
+            (end_pos, next_pos) = _game_end(buf, _RAW_START + self.index.frames[-1], 0, sizes)
+            if end_pos is not None and next_pos <= len(buf):
+                self.end = End._parse(memoryview(buf)[end_pos + 1:next_pos])
+
+    def _frame(self, start, end):
+        frames = []
+        _parse_events(self._buf, _RAW_START + start, _RAW_START + end, self._payload_sizes, {ParseEvent.FRAME: frames.append})
+        return frames[0]
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame_at(self, i: int) -> Frame:
+        """Parse a single frame.
+
+        :param i: index of the frame, as in :py:attr:`slippi.game.Game.frames` (0 is the first frame, negative values count from the end)"""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f'frame index out of range: {i}')
+        return self._frame(self.index.frames[2 * i], self.index.frames[2 * i + 1])
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Frame, List[Frame]]:
+        if isinstance(key, slice):
+            return [self.frame_at(i) for i in range(*key.indices(len(self)))]
+        return self.frame_at(key)
+
+    def rollbacks(self, i: int) -> List[Frame]:
+        """Parse the superseded copies (due to rollback) of a frame, oldest first.
+
+        :param i: index of the frame, as in :py:meth:`frame_at`"""
+        if i < 0:
+            i += len(self)
+        rollbacks = self.index.rollbacks
+        return [self._frame(rollbacks[j + 1], rollbacks[j + 2]) for j in range(0, len(rollbacks), 3)
+                if rollbacks[j] - FIRST_FRAME_INDEX == i]
+
+    def _attr_repr(self, attr):
+        if attr == 'metadata_raw':
+            return None
+        else:
+            return super()._attr_repr(attr)
@@ -1,7 +1,5 @@
 import logging, os
 
-from termcolor import colored
-
 
 COLORS = {
     'WARNING': 'yellow',
@@ -11,16 +9,33 @@ COLORS = {
     'ERROR': 'red'}
 
 
-_old_factory = logging.getLogRecordFactory()
-def record_factory(*args, **kwargs):
-    record = _old_factory(*args, **kwargs)
-    l = record.levelname
-    record.levelname_colored = colored(l, COLORS.get(l, 'white'))
-    return record
+def enable_colors():
+    """Color the level names in log output.
+
+    This installs a process-wide `LogRecordFactory`, and reformats the root logger's handlers to use it, so it's opt-in."""
+
+    from termcolor import colored
+
+    old_factory = logging.getLogRecordFactory()
+    if getattr(old_factory, '_slippi_colors', False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = old_factory(*args, **kwargs)
+        l = record.levelname
+        record.levelname_colored = colored(l, COLORS.get(l, 'white'))
+        return record
+    record_factory._slippi_colors = True
+
+    logging.setLogRecordFactory(record_factory)
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter('%(levelname_colored)s: %(message)s'))
 
 
-logging.setLogRecordFactory(record_factory)
 logging.basicConfig(
     level=os.environ.get('LOG_LEVEL', 'WARNING').upper(),
-    format="%(levelname_colored)s: %(message)s")
+    format="%(levelname)s: %(message)s")
 log = logging.getLogger()
+
+if os.environ.get('LOG_COLOR'):
+    enable_colors()
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-import io, os, pathlib
-from typing import BinaryIO, Callable, Dict, Union
+import collections, concurrent.futures, functools, io, logging, mmap, os, pathlib, struct, time
+from array import array
+from typing import Any, BinaryIO, Callable, Collection, Dict, Iterable, Iterator, Optional, Tuple, Union
 
 import ubjson
 
-from .event import End, EventType, Frame, Start
+from .event import FIRST_FRAME_INDEX, End, EventType, Frame, Start, _ReplayBuffer
 from .log import log
 from .metadata import Metadata
 from .util import *
@@ -22,6 +23,9 @@ class ParseEvent(Enum):
     FRAME_START = 'frame_start' #: :py:class:`slippi.event.Frame.Start`:
     ITEM = 'item' #: :py:class:`slippi.event.Frame.Item`:
     FRAME_END = 'frame_end' #: :py:class:`slippi.event.Frame.End`:
+    FRAME_BATCH = 'frame_batch' #: List[:py:class:`slippi.event.Frame`]: consecutive frames, up to `frame_batch_size` at a time
+    ROLLBACKS = 'rollbacks' #: :py:class:`array.array`: `(frame number, start, end)` offsets of each frame copy superseded by rollback, flattened (only with `skip_rollbacks`, before any other event)
+    RAW = 'raw' #: Tuple[int, memoryview]: the code & undecoded payload of every event (including event payloads, and types the parser doesn't know), as it's reached. The payload is a view of the parser's buffer; copy it (`bytes(payload)`) to keep it.
 
 
 class ParseError(IOError):
@@ -37,8 +41,142 @@ class ParseError(IOError):
             super().__str__())
 
 
-def _parse_event_payloads(stream):
-    (code, this_size) = unpack('BB', stream)
+class StopParsing(Exception):
+    """Raise from a handler to stop parsing early: no further events are decoded, but the game end event & metadata
+    are still read (without reading the frame data in between, when the replay's length is known)."""
+
+
+class Follow(Base):
+    """How to follow a replay that's still being written (see :py:func:`parse`).
+
+    When no new data is found, wait `poll_interval` seconds before looking again, doubling the wait each time (up to
+    `max_poll_interval`) until some arrives."""
+
+    poll_interval: float #: Initial wait for new data, in seconds
+    max_poll_interval: float #: Longest wait between looks for new data, in seconds
+    timeout: Optional[float] #: Give up after this many seconds without new data (None to wait forever)
+
+    def __init__(self, poll_interval: float = 0.004, max_poll_interval: float = 0.1, timeout: Optional[float] = 60.0):
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+
+
+class ParseStats(Base):
+    """Where parsing effort & time goes, for one replay or (added together) a batch of them.
+
+    Collected by :py:func:`parse` when it's given a `ParseStats` to update; otherwise nothing is measured. Times are in seconds."""
+
+    replays: int #: Replays parsed
+    event_counts: Dict[Union[EventType, int], int] #: Number of events of each type, including skipped events
+    event_bytes: Dict[Union[EventType, int], int] #: Total size of each type of event, including event codes
+    frames: int #: Frames passed to the `FRAME` handler
+    items: int #: Items decoded (on frames passed to the `FRAME` handler)
+    rollbacks: int #: Frames that were re-sent due to rollback (counted by :py:class:`slippi.game.Game`)
+    framing_time: float #: Time spent finding event boundaries (measured by a separate pass over the events)
+    decode_time: float #: Time spent decoding events, excluding handlers. Pre- & post-frame data is decoded on access, after parsing, so isn't included.
+    handler_time: float #: Time spent in handlers
+    metadata_time: float #: Time spent decoding metadata, excluding handlers
+    peak_buffer_size: int #: Size of the largest `raw` element read
+
+    def __init__(self):
+        self.replays = 0
+        self.event_counts = {}
+        self.event_bytes = {}
+        self.frames = 0
+        self.items = 0
+        self.rollbacks = 0
+        self.framing_time = 0.0
+        self.decode_time = 0.0
+        self.handler_time = 0.0
+        self.metadata_time = 0.0
+        self.peak_buffer_size = 0
+
+    def __add__(self, other):
+        if not isinstance(other, ParseStats):
+            return NotImplemented
+        total = ParseStats()
+        for attr in ('replays', 'frames', 'items', 'rollbacks', 'framing_time', 'decode_time', 'handler_time', 'metadata_time'):
+            setattr(total, attr, getattr(self, attr) + getattr(other, attr))
+        for stats in (self, other):
+            total._add_events(stats.event_counts, stats.event_bytes)
+        total.peak_buffer_size = max(self.peak_buffer_size, other.peak_buffer_size)
+        return total
+
+    def _add_events(self, counts, sizes):
+        for (event_type, count) in counts.items():
+            self.event_counts[event_type] = self.event_counts.get(event_type, 0) + count
+            self.event_bytes[event_type] = self.event_bytes.get(event_type, 0) + sizes[event_type]
+
+    def _tally(self, buf, pos, end, payload_sizes):
+        """Count the events in `buf[pos:end]` by type, the way `_parse_events` walks them. `pos` is the size of the
+        event payloads event, which precedes them."""
+
+        counts = {EventType.EVENT_PAYLOADS.value: 1}
+        sizes = {EventType.EVENT_PAYLOADS.value: pos}
+        stop_at_end = not end
+        end = end or len(buf)
+        while pos < end:
+            code = buf[pos]
+            size = payload_sizes.get(code)
+            if size is None: # left for the parser to report
+                break
+            counts[code] = counts.get(code, 0) + 1
+            sizes[code] = sizes.get(code, 0) + 1 + size
+            pos += 1 + size
+            if code == _GAME_END and stop_at_end:
+                break
+
+        def event_type(code):
+            try: return EventType(code)
+            except ValueError: return code
+
+        self._add_events({event_type(c): n for (c, n) in counts.items()}, {event_type(c): n for (c, n) in sizes.items()})
+
+    def _timed(self, handlers):
+        """Wrap `handlers` to time them, and to count the frames & items they're passed."""
+
+        # don't count frames twice if they're passed both individually & in batches
+        counted = ParseEvent.FRAME if ParseEvent.FRAME in handlers else ParseEvent.FRAME_BATCH
+
+        def timed(event, handler):
+            def wrapper(x):
+                if event is counted:
+                    frames = x if event is ParseEvent.FRAME_BATCH else (x,)
+                    self.frames += len(frames)
+                    self.items += sum(len(f.items) for f in frames)
+                start = time.perf_counter()
+                try: handler(x)
+                finally: self.handler_time += time.perf_counter() - start
+            return wrapper
+
+        return {event: timed(event, handler) for (event, handler) in handlers.items()}
+
+
+# Event codes, as plain ints for cheap comparison in the event loop.
+_GAME_START = EventType.GAME_START.value
+_FRAME_PRE = EventType.FRAME_PRE.value
+_FRAME_POST = EventType.FRAME_POST.value
+_GAME_END = EventType.GAME_END.value
+_FRAME_START = EventType.FRAME_START.value
+_ITEM = EventType.ITEM.value
+_FRAME_END = EventType.FRAME_END.value
+
+# Every frame event starts with the frame number, right after the event code
+_FRAME_EVENTS = frozenset((_FRAME_START, _FRAME_PRE, _FRAME_POST, _ITEM, _FRAME_END))
+
+#: Default number of frames passed to each `FRAME_BATCH` handler call
+FRAME_BATCH_SIZE = 1024
+
+# Headers shared by all frame events: frame index, then (for pre/post events) port & follower flag.
+_FRAME_ID = struct.Struct('>i')
+_PORT_ID = struct.Struct('>iB?')
+
+_EVENT_PAYLOADS = EventType.EVENT_PAYLOADS.value
+
+
+def _parse_event_payloads(buf, pos = 0):
+    (code, this_size) = (buf[pos], buf[pos + 1])
 
     event_type = EventType(code)
     if event_type is not EventType.EVENT_PAYLOADS:
@@ -51,201 +189,939 @@ def _parse_event_payloads(stream):
 
     sizes = {}
     for i in range(command_count):
-        (code, size) = unpack('BH', stream)
+        (code, size) = struct.unpack_from('>BH', buf, pos + 2 + i * 3)
         sizes[code] = size
         try: EventType(code)
-        except ValueError: log.info('ignoring unknown event type: 0x%02x' % code)
+        except ValueError: log.info('ignoring unknown event type: 0x%02x', code)
 
-    log.debug(f'event payload sizes: {sizes}')
+    log.debug('event payload sizes: %s', sizes)
     return (2 + this_size, sizes)
 
 
-def _parse_event(event_stream, payload_sizes):
-    (code,) = unpack('B', event_stream)
-    log.debug(f'Event: 0x{code:x}')
+def _raw_payloads(buf, size):
+    """The `RAW` parse event's object for the event payloads event at the start of `buf` (`size` bytes long)."""
 
-    # remember starting pos for better error reporting
-    try: base_pos = event_stream.tell() if event_stream.seekable() else None
-    except AttributeError: base_pos = None
+    return (_EVENT_PAYLOADS, memoryview(buf)[1:size])
 
-    try: size = payload_sizes[code]
-    except KeyError: raise ValueError('unexpected event type: 0x%02x' % code)
 
-    stream = io.BytesIO(event_stream.read(size))
+def _decoded_events(handlers, event_types):
+    """Codes of the events worth decoding: those that some handler will see, limited to `event_types` (if given)."""
 
-    try:
-        try: event_type = EventType(code)
-        except ValueError: event_type = None
-
-        if event_type is EventType.GAME_START:
-            event = Start._parse(stream)
-        elif event_type is EventType.FRAME_PRE:
-            event = Frame.Event(Frame.Event.PortId(stream),
-                                Frame.Event.Type.PRE,
-                                stream)
-        elif event_type is EventType.FRAME_POST:
-            event = Frame.Event(Frame.Event.PortId(stream),
-                                Frame.Event.Type.POST,
-                                stream)
-        elif event_type is EventType.FRAME_START:
-            event = Frame.Event(Frame.Event.Id(stream),
-                                Frame.Event.Type.START,
-                                stream)
-        elif event_type is EventType.ITEM:
-            event = Frame.Event(Frame.Event.Id(stream),
-                                Frame.Event.Type.ITEM,
-                                stream)
-        elif event_type is EventType.FRAME_END:
-            event = Frame.Event(Frame.Event.Id(stream),
-                                Frame.Event.Type.END,
-                                stream)
-        elif event_type is EventType.GAME_END:
-            event = End._parse(stream)
+    codes = set()
+    if ParseEvent.START in handlers:
+        codes.add(_GAME_START)
+    if ParseEvent.END in handlers:
+        codes.add(_GAME_END)
+    if ParseEvent.FRAME in handlers or ParseEvent.FRAME_BATCH in handlers:
+        codes |= _FRAME_EVENTS
+    if event_types is not None:
+        codes &= {EventType(t).value for t in event_types}
+    return frozenset(codes)
+
+
+def _scan_frames(buf, pos, end, payload_sizes, base_pos = 0):
+    """Record where each frame's events are in `buf`, without decoding them.
+
+    Only each frame's leading event (frame start, or the first pre-frame event before Slippi 3.0.0) is examined; every
+    other event is stepped over using its payload size.
+    Returns `(frames, rollbacks)`. `frames` holds a `(start, end)` pair of offsets per frame, for the last copy of each
+    frame. `rollbacks` holds a `(frame number, start, end)` triple per superseded copy."""
+
+    frames = array('q')
+    rollbacks = array('q')
+    current = None
+    frame_start = 0
+    stop_at_end = not end
+    end = end or len(buf)
+    lead = _FRAME_START if _FRAME_START in payload_sizes else _FRAME_PRE
+
+    def record(frame, start, stop):
+        idx = frame - FIRST_FRAME_INDEX
+        count = len(frames) // 2
+        if idx == count:
+            frames.extend((start, stop))
+        elif idx < count: # rollback
+            rollbacks.extend((frame, frames[2 * idx], frames[2 * idx + 1]))
+            frames[2 * idx] = start
+            frames[2 * idx + 1] = stop
         else:
-            event = None
-        return (1 + size, event)
-    except Exception as e:
-        # Calculate the stream position of the exception as best we can.
-        # This won't be perfect: for an invalid enum, the calculated position
-        # will be *after* the value at minimum, and may be farther than that
-        # due to `unpack`ing multiple values at once. But it's better than
-        # leaving it up to the `catch` clause in `parse`, because that will
-        # always report a position that's at the end of an event (due to
-        # `event_stream.read` above).
-        raise ParseError(str(e), pos = base_pos + stream.tell() if base_pos else None)
+            raise ParseError(f'missing frames: {count-1} -> {idx}', pos = base_pos + start)
 
+    while pos < end:
+        code = buf[pos]
+        try: size = payload_sizes[code]
+        except KeyError: raise ParseError('unexpected event type: 0x%02x' % code, pos = base_pos + pos)
 
-def _parse_events(stream, payload_sizes, total_size, handlers, skip_frames):
-    current_frame = None
-    bytes_read = 0
-    event = None
-
-    # `total_size` will be zero for in-progress replays
-    while (total_size == 0 or bytes_read < total_size) and event != ParseEvent.END:
-        (b, event) = _parse_event(stream, payload_sizes)
-        bytes_read += b
-        if isinstance(event, Start):
-            handler = handlers.get(ParseEvent.START)
-            if handler:
-                handler(event)
-            if skip_frames: 
-                skip = total_size - bytes_read - payload_sizes[EventType.GAME_END.value] - 1
-                stream.seek(skip, os.SEEK_CUR)
-                bytes_read += skip
+        if code == lead:
+            (frame,) = _FRAME_ID.unpack_from(buf, pos + 1)
+            if frame != current:
+                if current is not None:
+                    record(current, frame_start, pos)
+                current = frame
+                frame_start = pos
+        elif code == _GAME_END:
+            if current is not None:
+                record(current, frame_start, pos)
+                current = None
+            if stop_at_end:
+                break
+
+        pos += 1 + size
+
+    if current is not None:
+        record(current, frame_start, pos)
+
+    return (frames, rollbacks)
+
+
+_MAX_ROLLBACK = 7 # the most frames Slippi netplay will roll back
+
+
+def _game_end(buf, pos, end, payload_sizes, base_pos = 0):
+    """Find the game end event after stopping early at `pos`, without decoding anything before it.
+
+    Returns `(position of the game end event or None, position just past the last event)`."""
+
+    size = payload_sizes.get(_GAME_END)
+    if end:
+        # Finished replays end with the game end event, so look there instead of stepping through everything between.
+        tail = end - 1 - size if size is not None else -1
+        return (tail if tail >= pos and buf[tail] == _GAME_END else None, end)
+
+    end = len(buf)
+    while pos < end:
+        code = buf[pos]
+        try: next_pos = pos + 1 + payload_sizes[code]
+        except KeyError: raise ParseError('unexpected event type: 0x%02x' % code, pos = base_pos + pos)
+        if code == _GAME_END:
+            return (pos, next_pos)
+        pos = next_pos
+    return (None, pos)
+
+
+def _iter_events(buf, pos, end, payload_sizes, events, base_pos = 0, event_types = None, ports = None, followers = True,
+                 pre_fields = None, post_fields = None, frame_range = None, skip_rollbacks = False, partial = False):
+    """Decode events from `buf[pos:end]`, generating `(parse event, object, position)` for each game start, frame &
+    game end. `position` is that of the event that completed the object (for frames, the event after their last).
+
+    Each event's payload is handed to its decoder as a `memoryview` slice of `buf`, so no per-event copies are made.
+    Pre- & post-frame data just records the payload's offset in `buf` (shared by all frames), until it's accessed.
+    Events that wouldn't produce any of `events` (parse events), or whose types aren't in `event_types`, are skipped
+    over without being decoded.
+    So are pre- & post-frame events for ports not in `ports`, and for followers unless `followers` is true.
+    If `pre_fields`/`post_fields` are given, just those attributes are decoded, right away.
+    If `frame_range` is given, events for frames outside it are skipped, and decoding stops once it's safely past the
+    range (allowing for rollback); the game end event is then found by `_game_end`.
+    If `skip_rollbacks` is true, frames are located by `_scan_frames` first, and copies of frames that were later re-sent
+    (due to rollback) are skipped over whole; the `ROLLBACKS` event gives their offsets.
+    If `events` includes `RAW`, each event's code & payload is generated as it's reached (other than those skipped with
+    `skip_rollbacks`, or after stopping early for `frame_range`). If nothing needs decoding, events are just framed.
+    If `partial` is true, more events may follow `end` (a live replay), so a frame still in progress there isn't
+    emitted: the returned position is instead that of its first event, to parse it again from once it's complete.
+    Returns (as the generator's value) the position just past the last event consumed: `end`, or the end of the
+    `GAME_END` event if `end` is zero (in-progress replays don't record their length)."""
+
+    view = memoryview(buf)
+
+    # superseded copies of frames: start offset -> end offset
+    superseded = None
+    if skip_rollbacks:
+        (_, rollbacks) = _scan_frames(buf, pos, end, payload_sizes, base_pos)
+        superseded = {rollbacks[i + 1]: rollbacks[i + 2] for i in range(0, len(rollbacks), 3)}
+        if ParseEvent.ROLLBACKS in events:
+            yield (ParseEvent.ROLLBACKS, rollbacks, pos)
+
+    if not end:
+        end = len(buf)
+        stop_at_end = True
+    else:
+        stop_at_end = False
+
+    # Items are decoded eagerly, so pick their decoder once for this replay's payload size
+    parse_item = Frame.Item._decoder(payload_sizes[_ITEM]) if _ITEM in payload_sizes else None
+    parse_pre = Frame.Port.Data.Pre._projection(payload_sizes[_FRAME_PRE], pre_fields) \
+        if pre_fields is not None and _FRAME_PRE in payload_sizes else None
+    parse_post = Frame.Port.Data.Post._projection(payload_sizes[_FRAME_POST], post_fields) \
+        if post_fields is not None and _FRAME_POST in payload_sizes else None
+
+    source = _ReplayBuffer(buf, payload_sizes.get(_FRAME_PRE), payload_sizes.get(_FRAME_POST))
+
+    decoded = _decoded_events(events, event_types)
+    raw = ParseEvent.RAW in events
+
+    if not decoded and frame_range is None:
+        # Nothing to decode (e.g. just `RAW` handlers), so just step from one event to the next.
+        while pos < end:
+            code = buf[pos]
+            try: next_pos = pos + 1 + payload_sizes[code]
+            except KeyError: raise ParseError('unexpected event type: 0x%02x' % code, pos = base_pos + pos)
+            if superseded and pos in superseded:
+                pos = superseded[pos]
                 continue
-        elif isinstance(event, End):
-            handler = handlers.get(ParseEvent.END)
-            if handler:
-                handler(event)
-        elif isinstance(event, Frame.Event):
+            if raw:
+                yield (ParseEvent.RAW, (code, view[pos + 1:next_pos]), pos)
+            pos = next_pos
+            if code == _GAME_END and stop_at_end:
+                break
+        return pos
+
+    # pre/post events to keep, by `port << 1 | is_follower`
+    if ports is None and followers:
+        characters = None
+    else:
+        characters = frozenset(port << 1 | is_follower for port in (PORTS if ports is None else ports)
+                               for is_follower in ((0, 1) if followers else (0,)))
+
+    if frame_range is not None:
+        (first_frame, last_frame) = frame_range
+        first_frame = FIRST_FRAME_INDEX if first_frame is None else first_frame
+        last_frame = float('inf') if last_frame is None else last_frame
+
+    # checked once, so that per-event logging costs nothing unless enabled
+    debug = log.isEnabledFor(logging.DEBUG)
+
+    current_frame = None
+    past_range = False
+
+    while pos < end:
+        code = buf[pos]
+        if debug:
+            log.debug('Event: 0x%x', code)
+
+        try: size = payload_sizes[code]
+        except KeyError: raise ParseError('unexpected event type: 0x%02x' % code, pos = base_pos + pos)
+
+        if superseded and pos in superseded:
+            pos = superseded[pos]
+            continue
+
+        if raw:
+            yield (ParseEvent.RAW, (code, view[pos + 1:pos + 1 + size]), pos)
+
+        if code not in decoded:
+            if code == _FRAME_END and current_frame and _FRAME_ID.unpack_from(buf, pos + 1)[0] == current_frame.index:
+                # a bookend completes its frame, even if the bookend itself isn't wanted
+                current_frame._finalize()
+                yield (ParseEvent.FRAME, current_frame, pos + 1 + size)
+                current_frame = None
+            pos += 1 + size
+            if code == _GAME_END and stop_at_end:
+                break
+            continue
+
+        if characters is not None and (code == _FRAME_PRE or code == _FRAME_POST) \
+                and (buf[pos + 5] << 1 | buf[pos + 6]) not in characters:
+            pos += 1 + size
+            continue
+
+        event_pos = pos
+        pos += 1 + size
+
+        try:
+            if code == _FRAME_PRE or code == _FRAME_POST:
+                # no slice: the payload is decoded (if ever) straight from `buf`
+                (frame_index, port_index, is_follower) = _PORT_ID.unpack_from(buf, event_pos + 1)
+            else:
+                data = view[event_pos + 1:pos]
+                if code == _FRAME_START or code == _ITEM or code == _FRAME_END:
+                    (frame_index,) = _FRAME_ID.unpack_from(data)
+                elif code == _GAME_START:
+                    yield (ParseEvent.START, Start._parse(data), event_pos)
+                    continue
+                elif code == _GAME_END:
+                    yield (ParseEvent.END, End._parse(data), event_pos)
+                    if stop_at_end:
+                        break
+                    continue
+                else:
+                    continue
+
             # Accumulate all events for a single frame into a single `Frame` object.
 
-            # We can't use Frame Bookend events to detect end-of-frame,
-            # as they don't exist before Slippi 3.0.0.
-            if current_frame and current_frame.index != event.id.frame:
+            # Since Slippi 3.0.0, a frame bookend event ends each frame (see below). Before that,
+            # a frame is only known to be complete once the next one starts.
+            if current_frame and current_frame.index != frame_index:
                 current_frame._finalize()
-                handler = handlers.get(ParseEvent.FRAME)
-                if handler:
-                    handler(current_frame)
+                yield (ParseEvent.FRAME, current_frame, event_pos)
                 current_frame = None
 
+            if frame_range is not None and not first_frame <= frame_index <= last_frame:
+                if frame_index > last_frame + _MAX_ROLLBACK:
+                    past_range = True
+                    break
+                continue
+
             if not current_frame:
-                current_frame = Frame(event.id.frame)
+                current_frame = Frame(frame_index)
+                frame_pos = event_pos
 
-            if event.type is Frame.Event.Type.PRE or event.type is Frame.Event.Type.POST:
-                port = current_frame.ports[event.id.port]
+            if code == _FRAME_PRE or code == _FRAME_POST:
+                port = current_frame.ports[port_index]
                 if not port:
-                    port = Frame.Port()
-                    current_frame.ports[event.id.port] = port
+                    port = Frame.Port(source)
+                    current_frame.ports[port_index] = port
 
-                if event.id.is_follower:
+                if is_follower:
                     if port.follower is None:
-                        port.follower = Frame.Port.Data()
-                    data = port.follower
+                        port.follower = Frame.Port.Data(source)
+                    port_data = port.follower
                 else:
-                    data = port.leader
+                    port_data = port.leader
 
-                if event.type is Frame.Event.Type.PRE:
-                    data._pre = event.data
+                if code == _FRAME_PRE:
+                    port_data._pre = parse_pre(buf, event_pos + 1) if parse_pre else event_pos + 1
                 else:
-                    data._post = event.data
-            elif event.type is Frame.Event.Type.ITEM:
-                current_frame.items.append(Frame.Item._parse(event.data))
-            elif event.type is Frame.Event.Type.START:
-                current_frame.start = Frame.Start._parse(event.data)
-            elif event.type is Frame.Event.Type.END:
-                current_frame.end = Frame.End._parse(event.data)
+                    port_data._post = parse_post(buf, event_pos + 1) if parse_post else event_pos + 1
+            elif code == _ITEM:
+                current_frame.items.append(parse_item(data))
+            elif code == _FRAME_START:
+                current_frame.start = Frame.Start._parse(data)
             else:
-                raise Exception('unknown frame data type: %s' % event.data)
+                # Emit the frame right away, rather than waiting for the next one to start (which, for a live
+                # replay, is a frame later).
+                current_frame.end = Frame.End._parse(data)
+                current_frame._finalize()
+                yield (ParseEvent.FRAME, current_frame, pos)
+                current_frame = None
+        except ParseError: raise
+        except Exception as e:
+            # Report the position of the event that failed to decode.
+            raise ParseError(str(e), pos = base_pos + event_pos) from e
 
     if current_frame:
+        if partial:
+            return frame_pos
         current_frame._finalize()
-        handler = handlers.get(ParseEvent.FRAME)
-        if handler:
-            handler(current_frame)
+        yield (ParseEvent.FRAME, current_frame, pos)
+
+    if past_range:
+        (end_pos, pos) = _game_end(buf, pos, 0 if stop_at_end else end, payload_sizes, base_pos)
+        if end_pos is not None and _GAME_END in decoded:
+            yield (ParseEvent.END, End._parse(view[end_pos + 1:end_pos + 1 + payload_sizes[_GAME_END]]), end_pos)
+
+    return pos
+
+
+def _parse_events(buf, pos, end, payload_sizes, handlers, base_pos = 0, event_types = None, ports = None, followers = True,
+                  pre_fields = None, post_fields = None, frame_batch_size = FRAME_BATCH_SIZE, frame_range = None,
+                  skip_rollbacks = False):
+    """Decode events from `buf[pos:end]` (see `_iter_events`), passing them to `handlers`.
+
+    Frames go to the `FRAME` handler one at a time, and/or to the `FRAME_BATCH` handler in lists of `frame_batch_size`.
+    If a handler raises `StopParsing`, frames already passed to `FRAME` are flushed to `FRAME_BATCH`, and the game end
+    event (if not yet seen) is found by `_game_end`.
+    Returns the position just past the last event consumed."""
+
+    on_start = handlers.get(ParseEvent.START)
+    on_end = handlers.get(ParseEvent.END)
+    on_frame = handlers.get(ParseEvent.FRAME)
+    on_frame_batch = handlers.get(ParseEvent.FRAME_BATCH)
+    on_raw = handlers.get(ParseEvent.RAW)
+    batch = []
+    end_pos = None
+
+    events = _iter_events(buf, pos, end, payload_sizes, handlers.keys(), base_pos, event_types, ports, followers,
+                          pre_fields, post_fields, frame_range, skip_rollbacks)
+    try:
+        while True:
+            try: (event, x, event_pos) = next(events)
+            except StopIteration as stop:
+                pos = stop.value
+                break
+
+            try:
+                if event is ParseEvent.RAW:
+                    on_raw(x)
+                elif event is ParseEvent.FRAME:
+                    if on_frame:
+                        on_frame(x)
+                    if on_frame_batch:
+                        batch.append(x)
+                        if len(batch) == frame_batch_size:
+                            (full, batch) = (batch, [])
+                            on_frame_batch(full)
+                elif event is ParseEvent.START:
+                    if on_start:
+                        on_start(x)
+                elif event is ParseEvent.ROLLBACKS:
+                    handlers[event](x)
+                else:
+                    end_pos = event_pos
+                    if on_end:
+                        on_end(x)
+            except (ParseError, StopParsing): raise
+            except Exception as e:
+                # Report handler exceptions at the event that triggered them.
+                raise ParseError(str(e), pos = base_pos + event_pos) from e
+
+        if batch:
+            on_frame_batch(batch)
+    except StopParsing:
+        events.close()
+        if batch:
+            try: on_frame_batch(batch)
+            except StopParsing: pass
+        if end_pos is not None: # already handled
+            return _game_end(buf, end_pos, end, payload_sizes, base_pos)[1]
 
+        (end_pos, pos) = _game_end(buf, event_pos, end, payload_sizes, base_pos)
+        if end_pos is not None and on_end and (event_types is None or EventType.GAME_END in event_types):
+            try: on_end(End._parse(memoryview(buf)[end_pos + 1:end_pos + 1 + payload_sizes[_GAME_END]]))
+            except StopParsing: pass
+
+    return pos
+
+
+def _read(stream, size = -1):
+    """Read `size` bytes (or the rest of the stream) from `stream`. Memory-mapped input is not copied: we return a
+    view of the mapping instead, which decoded events (including lazy frame data) can then refer to directly."""
+
+    if isinstance(stream, mmap.mmap):
+        pos = stream.tell()
+        end = len(stream) if size < 0 else min(pos + size, len(stream))
+        stream.seek(end)
+        return memoryview(stream)[pos:end]
+    else:
+        return stream.read(size)
+
+
+def _read_skipping_frames(stream, length):
+    """Read just the event payload sizes, game start & game end events from a seekable stream's `raw` element."""
+
+    header = stream.read(2)
+    payloads = header + stream.read(header[1] - 1)
+    (bytes_read, payload_sizes) = _parse_event_payloads(payloads)
+    start = stream.read(1 + payload_sizes[_GAME_START])
+    end_size = 1 + payload_sizes[_GAME_END]
+    stream.seek(length - bytes_read - len(start) - end_size, os.SEEK_CUR)
+    return payloads + start + stream.read(end_size)
+
+
+_RAW_START = 15 # length of the `{U\x03raw[$U#l` header plus the raw length
+
+
+def _read_raw(stream, skip_frames):
+    """Read a replay's `raw` element, returning it & its length (0 for in-progress replays)."""
 
-def _parse(stream, handlers, skip_frames):
     # For efficiency, don't send the whole file through ubjson.
     # Instead, assume `raw` is the first element. This is brittle and
     # ugly, but it's what the official parser does so it should be OK.
     expect_bytes(b'{U\x03raw[$U#l', stream)
     (length,) = unpack('l', stream)
 
-    (bytes_read, payload_sizes) = _parse_event_payloads(stream)
-    _parse_events(stream, payload_sizes, length - bytes_read, handlers, skip_frames)
+    # Read the whole `raw` element at once; events are decoded straight out of this one buffer.
+    if skip_frames:
+        buf = _read_skipping_frames(stream, length)
+    elif length:
+        buf = _read(stream, length)
+    else: # in-progress replay
+        buf = _read(stream)
 
-    expect_bytes(b'U\x08metadata', stream)
+    if length and not skip_frames and len(buf) < length:
+        raise EOFError()
 
+    return (buf, length)
+
+
+def _read_metadata(stream, buf, pos, length):
+    """Read the UBJSON metadata following the `raw` element. `pos` is the end of the last event in `buf`."""
+
+    if not length:
+        # anything after the last event is the start of the metadata
+        stream = io.BytesIO(buf[pos:])
+
+    expect_bytes(b'U\x08metadata', stream)
     json = ubjson.load(stream)
-    raw_handler = handlers.get(ParseEvent.METADATA_RAW)
-    if raw_handler:
-        raw_handler(json)
+    expect_bytes(b'}', stream)
+    return json
 
-    metadata = Metadata._parse(json)
-    handler = handlers.get(ParseEvent.METADATA)
+
+def _parse(stream, handlers, skip_frames, parse_events = _parse_events, stats = None):
+    (buf, length) = _read_raw(stream, skip_frames)
+    (bytes_read, payload_sizes) = _parse_event_payloads(buf)
+
+    if stats is not None:
+        stats.replays += 1
+        stats.peak_buffer_size = max(stats.peak_buffer_size, len(buf))
+        start = time.perf_counter()
+        stats._tally(buf, bytes_read, len(buf) if length else 0, payload_sizes)
+        stats.framing_time += time.perf_counter() - start
+        handlers = stats._timed(handlers)
+        (handler_time, start) = (stats.handler_time, time.perf_counter())
+
+    handler = handlers.get(ParseEvent.RAW)
     if handler:
-        handler(metadata)
+        handler(_raw_payloads(buf, bytes_read))
 
-    expect_bytes(b'}', stream)
+    pos = parse_events(buf, bytes_read, len(buf) if length else 0, payload_sizes, handlers, _RAW_START)
 
+    if stats is not None:
+        stats.decode_time += time.perf_counter() - start - (stats.handler_time - handler_time)
+        (handler_time, start) = (stats.handler_time, time.perf_counter())
 
-def _parse_try(input: BinaryIO, handlers, skip_frames):
+    raw_handler = handlers.get(ParseEvent.METADATA_RAW)
+    handler = handlers.get(ParseEvent.METADATA)
+    if raw_handler or handler:
+        json = _read_metadata(stream, buf, pos, length)
+        if raw_handler:
+            raw_handler(json)
+        if handler:
+            handler(Metadata._parse(json))
+
+    if stats is not None:
+        stats.metadata_time += time.perf_counter() - start - (stats.handler_time - handler_time)
+
+
+def _parse_try(input: Union[BinaryIO, mmap.mmap], handlers, skip_frames, parse_events, filename = None, stats = None):
     """Wrap parsing exceptions with additional information."""
 
     try:
-        _parse(input, handlers, skip_frames)
+        _parse(input, handlers, skip_frames, parse_events, stats)
+    except StopParsing: pass # from a metadata handler
     except Exception as e:
-        e = e if isinstance(e, ParseError) else ParseError(str(e))
+        raise _parse_error(e, input, filename)
 
-        try: e.filename = input.name # type: ignore
-        except AttributeError: pass
 
-        try:
-            # prefer provided position info, as it will be more accurate
-            if not e.pos and input.seekable(): # type: ignore
-                e.pos = input.tell() # type: ignore
-        # not all stream-like objects support `seekable` (e.g. HTTP requests)
-        except AttributeError: pass
+def _parse_error(e, input, filename = None):
+    e = e if isinstance(e, ParseError) else ParseError(str(e))
+
+    try: e.filename = filename or input.name # type: ignore
+    except AttributeError: pass
 
-        raise e
+    try:
+        # prefer provided position info, as it will be more accurate
+        if not e.pos and input.seekable(): # type: ignore
+            e.pos = input.tell() # type: ignore
+    # not all stream-like objects support `seekable` (e.g. HTTP requests)
+    except AttributeError: pass
 
+    return e
 
-def _parse_open(input: os.PathLike, handlers, skip_frames) -> None:
+
+def _parse_open(input: os.PathLike, handlers, skip_frames, parse_events, use_mmap, stats = None) -> None:
     with open(input, 'rb') as f:
-        _parse_try(f, handlers, skip_frames)
+        if use_mmap:
+            # Don't close the mapping when we're done: lazily-decoded frame data refers
+            # to it, and it's released along with the last such reference.
+            try: m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception as e: raise _parse_error(e, f, f.name)
+            _parse_try(m, handlers, skip_frames, parse_events, f.name, stats)
+        else:
+            _parse_try(f, handlers, skip_frames, parse_events, stats=stats)
 
 
-def parse(input: Union[BinaryIO, str, os.PathLike], handlers: Dict[ParseEvent, Callable[..., None]], skip_frames: bool = False) -> None:
+def parse(input: Union[BinaryIO, str, os.PathLike], handlers: Dict[ParseEvent, Callable[..., None]], skip_frames: bool = False,
+          use_mmap: bool = False, event_types: Optional[Collection[EventType]] = None, ports: Optional[Collection[int]] = None,
+          followers: bool = True, pre_fields: Optional[Collection[str]] = None,
+          post_fields: Optional[Collection[str]] = None, stats: Optional[ParseStats] = None,
+          frame_batch_size: int = FRAME_BATCH_SIZE,
+          frame_range: Optional[Tuple[Optional[int], Optional[int]]] = None, skip_rollbacks: bool = False,
+          follow: Union[bool, Follow] = False) -> None:
     """Parse a Slippi replay.
 
     :param input: replay file object or path
-    :param handlers: dict of parse event keys to handler functions. Each event will be passed to the corresponding handler as it occurs.
-    :param skip_frames: when true, skip past all frame data. Requires input to be seekable."""
+    :param handlers: dict of parse event keys to handler functions. Each event will be passed to the corresponding handler as it occurs. A handler can raise :py:class:`StopParsing` to skip the rest of the frames. With just `RAW` (and metadata) handlers, nothing is decoded: the parser only finds where each event is.
+    :param skip_frames: when true, skip past all frame data. Requires input to be seekable.
+    :param use_mmap: when true and `input` is a path, memory-map the file (read-only) instead of reading it into memory. Frame data refers directly to the mapping, so the OS page cache backs it. An already-open :py:class:`mmap.mmap` may also be passed as `input`.
+    :param event_types: types of events to decode; others are skipped using their payload sizes. Frame data from skipped event types will be missing (e.g. without `ITEM`, frames won't have any items). Events that no handler would see are always skipped.
+    :param ports: ports whose pre- & post-frame data to decode (port 1 is 0). Frames will contain None for other ports.
+    :param followers: when false, skip pre- & post-frame data for followers (Nana).
+    :param pre_fields: attributes of :py:class:`slippi.event.Frame.Port.Data.Pre` to decode, e.g. `{'state', 'buttons'}`. Only the payload bytes they need are read, and other attributes will be unset (accessing them raises `AttributeError`). By default, every attribute is decoded.
+    :param post_fields: attributes of :py:class:`slippi.event.Frame.Port.Data.Post` to decode, as for `pre_fields`.
+    :param stats: if given, add this replay's event counts & parse timings to it.
+    :param frame_batch_size: maximum number of frames passed to each call of the `FRAME_BATCH` handler.
+    :param frame_range: `(first, last)` frame numbers (as in :py:attr:`slippi.event.Frame.index`, inclusive; either may be None) of the frames to decode. Earlier frames are skipped using their payload sizes, and parsing stops shortly after `last` (allowing for rollback). `START`, `END` & metadata are still parsed. For paths, this implies `use_mmap`, so the skipped parts of the file aren't read.
+    :param skip_rollbacks: when true, find each frame's events before decoding anything (a cheap scan of frame numbers), and only decode the last copy of each frame. Copies that were re-sent due to rollback are skipped, and their offsets passed to the `ROLLBACKS` handler. This saves time on netplay replays with a lot of rollback.
+    :param follow: when true (or a :py:class:`Follow`), the replay may still be being written: wait for more data as needed, until the game ends & its metadata is written. Frames are passed to handlers as soon as they're complete, and the `FRAME_BATCH` handler gets whatever frames each read completes. `skip_frames`, `use_mmap`, `stats`, `frame_batch_size`, `frame_range` and `skip_rollbacks` don't apply."""
+
+    if follow:
+        options = _event_options(event_types, ports, followers, pre_fields, post_fields)
+        _dispatch(input, handlers, _follow(input, frozenset(handlers), follow, options))
+        return
+
+    options = _event_options(event_types, ports, followers, pre_fields, post_fields, frame_range, skip_rollbacks)
+    parse_events = _parse_events
+    if options or frame_batch_size != FRAME_BATCH_SIZE:
+        parse_events = functools.partial(_parse_events, frame_batch_size=frame_batch_size, **options)
+
+    _parse_input(input, handlers, skip_frames, parse_events, use_mmap or frame_range is not None, stats)
+
+
+def _event_options(event_types, ports, followers, pre_fields, post_fields, frame_range = None, skip_rollbacks = False):
+    """Keyword arguments for `_iter_events`, for just the options that differ from the defaults."""
+
+    options = {}
+    if event_types is not None:
+        options['event_types'] = frozenset(event_types)
+    if ports is not None:
+        options['ports'] = frozenset(ports)
+    if not followers:
+        options['followers'] = False
+    if pre_fields is not None:
+        options['pre_fields'] = frozenset(pre_fields)
+    if post_fields is not None:
+        options['post_fields'] = frozenset(post_fields)
+    if frame_range is not None:
+        options['frame_range'] = tuple(frame_range)
+    if skip_rollbacks:
+        options['skip_rollbacks'] = True
+    return options
+
+
+def _iter_parse(stream, events, skip_frames, options):
+    (buf, length) = _read_raw(stream, skip_frames)
+    (bytes_read, payload_sizes) = _parse_event_payloads(buf)
+    if ParseEvent.RAW in events:
+        yield (ParseEvent.RAW, _raw_payloads(buf, bytes_read))
+
+    decoded = _iter_events(buf, bytes_read, len(buf) if length else 0, payload_sizes, events, _RAW_START, **options)
+    while True:
+        try: (event, x, _) = next(decoded)
+        except StopIteration as stop:
+            pos = stop.value
+            break
+        yield (event, x)
+
+    if ParseEvent.METADATA_RAW in events or ParseEvent.METADATA in events:
+        json = _read_metadata(stream, buf, pos, length)
+        if ParseEvent.METADATA_RAW in events:
+            yield (ParseEvent.METADATA_RAW, json)
+        if ParseEvent.METADATA in events:
+            yield (ParseEvent.METADATA, Metadata._parse(json))
+
+
+def iter_events(input: Union[BinaryIO, str, os.PathLike],
+                events: Collection[ParseEvent] = (ParseEvent.START, ParseEvent.FRAME, ParseEvent.END, ParseEvent.METADATA),
+                skip_frames: bool = False, use_mmap: bool = True, event_types: Optional[Collection[EventType]] = None,
+                ports: Optional[Collection[int]] = None, followers: bool = True,
+                pre_fields: Optional[Collection[str]] = None, post_fields: Optional[Collection[str]] = None,
+                frame_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                skip_rollbacks: bool = False, follow: Union[bool, Follow] = False) -> Iterator[Tuple[ParseEvent, Any]]:
+    """Parse a Slippi replay lazily, generating `(parse event, object)` pairs as it goes.
+
+    Unlike :py:func:`parse`, the caller is in control: stop iterating at any point, and the rest of the replay is never
+    decoded. Frames are generated as they're completed, so frames that were re-sent due to rollback appear more than
+    once (see :py:class:`slippi.game.Game` for how to resolve them), unless `skip_rollbacks` is true.
+
+    :param input: replay file object or path
+    :param events: parse events to generate: any of `ROLLBACKS`, `START`, `FRAME`, `END`, `METADATA_RAW` and `METADATA`, in that order, and `RAW` (for each event, before anything it completes)
+    :param skip_frames: when true, skip past all frame data. Requires input to be seekable.
+    :param use_mmap: when true and `input` is a path, memory-map the file, so only the parts that are used get read. Unlike :py:func:`parse`, this defaults to true: otherwise the whole replay is read into memory before the first event is generated, whether or not the caller goes on to use it.
+    :param event_types: types of events to decode (see :py:func:`parse`)
+    :param ports: ports whose pre- & post-frame data to decode (see :py:func:`parse`)
+    :param followers: when false, skip pre- & post-frame data for followers (Nana)
+    :param pre_fields: pre-frame attributes to decode (see :py:func:`parse`)
+    :param post_fields: post-frame attributes to decode (see :py:func:`parse`)
+    :param frame_range: `(first, last)` frame numbers of the frames to generate (see :py:func:`parse`)
+    :param skip_rollbacks: when true, only generate the last copy of each frame (see :py:func:`parse`)
+    :param follow: when true (or a :py:class:`Follow`), follow a replay that's still being written (see :py:func:`parse`)"""
+
+    events = frozenset(events)
+    if follow:
+        yield from _follow(input, events, follow, _event_options(event_types, ports, followers, pre_fields, post_fields))
+        return
+
+    options = _event_options(event_types, ports, followers, pre_fields, post_fields, frame_range, skip_rollbacks)
+
+    if isinstance(input, (str, os.PathLike)):
+        with open(input, 'rb') as f:
+            stream: Union[BinaryIO, mmap.mmap] = f
+            try:
+                if use_mmap:
+                    # as in `_parse_open`, the mapping stays open for as long as frame data refers to it
+                    stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                yield from _iter_parse(stream, events, skip_frames, options)
+            except Exception as e: raise _parse_error(e, stream, f.name)
+    else:
+        try: yield from _iter_parse(input, events, skip_frames, options)
+        except Exception as e: raise _parse_error(e, input)
+
+
+def iter_frames(input: Union[BinaryIO, str, os.PathLike], use_mmap: bool = True,
+                event_types: Optional[Collection[EventType]] = None, ports: Optional[Collection[int]] = None,
+                followers: bool = True, pre_fields: Optional[Collection[str]] = None,
+                post_fields: Optional[Collection[str]] = None,
+                frame_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                skip_rollbacks: bool = False, follow: Union[bool, Follow] = False) -> Iterator[Frame]:
+    """Parse a Slippi replay lazily, generating its frames as they're completed (see :py:func:`iter_events`).
+
+    For example, `itertools.islice(iter_frames(path), 600)` only decodes the first ten seconds of a game, and
+    `iter_frames(path, follow=True)` generates the frames of a game in progress as they're played."""
+
+    for (_, frame) in iter_events(input, (ParseEvent.FRAME,), False, use_mmap, event_types, ports, followers,
+                                  pre_fields, post_fields, frame_range, skip_rollbacks, follow):
+        yield frame
+
+
+class Peek(Base):
+    """A replay's game start, game end & metadata, read without going anywhere near its frames (see :py:func:`peek`)."""
+
+    start: Start #: Information about the start of the game
+    end: Optional[End] #: Information about the end of the game (None for replays that are still being written, or that didn't end cleanly)
+    metadata: Optional[Metadata] #: Miscellaneous data not directly provided by Melee (None for replays that are still being written)
+    metadata_raw: Optional[dict] #: Raw JSON metadata, for debugging and forward-compatibility
+
+    def __init__(self, start: Start, end: Optional[End], metadata_raw: Optional[dict]):
+        self.start = start
+        self.end = end
+        self.metadata_raw = metadata_raw
+        self.metadata = None if metadata_raw is None else Metadata._parse(metadata_raw)
+
+
+_PEEK_SIZE = 4096 # enough for the header, event payloads & game start of any replay so far
+
+
+def _read_exactly(stream, buf, size):
+    """Extend `buf` to `size` bytes from `stream`."""
+
+    while len(buf) < size:
+        data = stream.read(size - len(buf))
+        if not data:
+            raise EOFError()
+        buf += data
+    return buf
+
+
+def _peek(stream):
+    head = stream.read(_PEEK_SIZE)
+    head = _read_exactly(stream, head, _RAW_START + 2)
+    expect_bytes(b'{U\x03raw[$U#l', io.BytesIO(head))
+    (length,) = struct.unpack_from('>l', head, _RAW_START - 4)
+
+    head = _read_exactly(stream, head, _RAW_START + 1 + head[_RAW_START + 1])
+    (pos, payload_sizes) = _parse_event_payloads(head, _RAW_START)
+    pos += _RAW_START
+    head = _read_exactly(stream, head, pos + 1 + payload_sizes[_GAME_START])
+    if head[pos] != _GAME_START:
+        raise ParseError('expected game start, but got: 0x%02x' % head[pos], pos = pos)
+    start = Start._parse(memoryview(head)[pos + 1:pos + 1 + payload_sizes[_GAME_START]])
+
+    if not length: # still being written, so no way to find the end
+        return Peek(start, None, None)
+
+    # The game end event is the last one in the `raw` element (if the game ended cleanly), and the metadata follows it.
+    end_size = payload_sizes.get(_GAME_END, 0)
+    tail_pos = _RAW_START + length - 1 - end_size
+    stream.seek(tail_pos)
+    tail = stream.read()
+    end = End._parse(memoryview(tail)[1:1 + end_size]) if end_size and tail[:1] == bytes((_GAME_END,)) else None
+    return Peek(start, end, _read_metadata(io.BytesIO(tail[1 + end_size:]), None, 0, length))
+
+
+def peek(input: Union[BinaryIO, str, os.PathLike]) -> Peek:
+    """Read just a replay's game start, game end & metadata, for e.g. listing replays.
+
+    Only the start of the file (header, event payloads & game start) and its end (game end & metadata) are read, in
+    about two small reads; the frames in between are never touched.
+
+    :param input: replay file object (must be seekable) or path"""
+
+    if isinstance(input, (str, os.PathLike)):
+        try: f = open(input, 'rb', buffering=0)
+        except OSError as e: raise _parse_error(e, input, os.fspath(input)) from e
+        with f:
+            try: return _peek(f)
+            except Exception as e: raise _parse_error(e, f)
+    else:
+        try: return _peek(input)
+        except Exception as e: raise _parse_error(e, input)
+
+
+def _peek_or_error(path):
+    try: return peek(path)
+    except ParseError as e: return e
+
+
+def peek_dir(directory: Union[str, os.PathLike, Iterable[Union[str, os.PathLike]]], recursive: bool = True,
+             workers: int = 8) -> Iterator[Tuple[str, Union[Peek, ParseError]]]:
+    """Peek at every replay in a directory (see :py:func:`peek`), generating `(path, Peek)` pairs in order of path.
+
+    A replay that can't be read gives its :py:class:`ParseError` in place of a `Peek`, rather than stopping the rest.
+
+    :param directory: directory of replays (`*.slp` files), or an iterable of replay paths
+    :param recursive: when true, include replays in subdirectories (e.g. Slippi's monthly folders)
+    :param workers: number of replays to read at once (reads are mostly waiting on the disk)"""
+
+    paths: Iterable[Union[str, os.PathLike]]
+    if isinstance(directory, (str, os.PathLike)):
+        directory = pathlib.Path(directory)
+        paths = sorted((directory.rglob if recursive else directory.glob)('*.slp'))
+    else:
+        paths = directory
+
+    # Only keep a few reads ahead of the caller, so stopping early doesn't wait for (or buffer) the rest.
+    pending: collections.deque = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        try:
+            for path in paths:
+                pending.append((path, executor.submit(_peek_or_error, path)))
+                if len(pending) > 2 * workers:
+                    (path, future) = pending.popleft()
+                    yield (os.fspath(path), future.result())
+            while pending:
+                (path, future) = pending.popleft()
+                yield (os.fspath(path), future.result())
+        finally:
+            for (_, future) in pending:
+                future.cancel()
+
+
+def _read_more(stream, follow):
+    """Wait for, and read, more of a live replay."""
+
+    read = getattr(stream, 'read1', stream.read)
+    interval = follow.poll_interval
+    since = time.monotonic()
+    while True:
+        data = read(1 << 20)
+        if data:
+            return data
+        if follow.timeout is not None and time.monotonic() - since >= follow.timeout:
+            raise ParseError('timed out waiting for replay data')
+        time.sleep(interval)
+        interval = min(2 * interval, follow.max_poll_interval)
+
+
+def _iter_live(read, events, options, raw = False, on_game = None):
+    """Generate `(parse event, object)` pairs from a replay as it's written, calling `read()` for more data as needed.
+
+    Only the unparsed end of what's been read is kept between reads: any incomplete event, plus the events of a frame
+    that's still in progress (which are decoded again once it's complete). Each `FRAME_BATCH` holds the frames
+    completed by a single read.
+
+    If `raw` is true, the stream is just events, with no UBJSON wrapper or metadata (as relayed from a console). It
+    may hold several games one after another, and ends cleanly if `read` raises `EOFError` between games.
+    `on_game(pos, prefix)` is called as each game starts, with its position in the stream & its first bytes (event
+    payloads & game start), and `on_game(None, None)` as it ends."""
+
+    buf = b''
+    base_pos = 0 # position of `buf` in the stream
+    if not raw:
+        while len(buf) < _RAW_START:
+            buf += read()
+        expect_bytes(b'{U\x03raw[$U#l', io.BytesIO(buf))
+        buf = buf[_RAW_START:]
+        base_pos = _RAW_START
+
+    while True:
+        if raw and not buf:
+            try: buf = read()
+            except EOFError: return
+
+        (buf, base_pos, end) = yield from _iter_live_game(read, buf, base_pos, events, options, on_game)
+        if not raw:
+            break
+
+        buf = buf[end:]
+        base_pos += end
+
+    if ParseEvent.METADATA_RAW in events or ParseEvent.METADATA in events:
+        # the metadata may not all be written yet
+        while True:
+            try:
+                json = _read_metadata(None, buf, end, 0)
+                break
+            except Exception:
+                buf += read()
+        if ParseEvent.METADATA_RAW in events:
+            yield (ParseEvent.METADATA_RAW, json)
+        if ParseEvent.METADATA in events:
+            yield (ParseEvent.METADATA, Metadata._parse(json))
+
+
+def _iter_live_game(read, buf, base_pos, events, options, on_game):
+    """Generate a live game's events (see `_iter_live`), from its event payloads to its game end. Returns the buffer
+    last read into, its position in the stream, and the end of the game end event within it."""
+
+    while len(buf) < 2 or len(buf) < 1 + buf[1]:
+        buf += read()
+    (pos, payload_sizes) = _parse_event_payloads(buf)
+    if ParseEvent.RAW in events:
+        yield (ParseEvent.RAW, _raw_payloads(buf, pos))
+
+    if on_game:
+        # the payloads & the following event (game start) identify the game
+        while len(buf) <= pos or len(buf) < pos + 1 + payload_sizes.get(buf[pos], 0):
+            buf += read()
+        on_game(base_pos, buf[:pos + 1 + payload_sizes.get(buf[pos], 0)])
+
+    batch = [] if ParseEvent.FRAME_BATCH in events else None
+    raw_pos = pos # events before this have been generated as `RAW` already (an unfinished frame's are decoded again)
+    while True:
+        # Only hand complete events to `_iter_events`, up to the game end.
+        end = pos
+        ended = False
+        while end < len(buf):
+            code = buf[end]
+            try: size = payload_sizes[code]
+            except KeyError: raise ParseError('unexpected event type: 0x%02x' % code, pos = base_pos + end)
+            if end + 1 + size > len(buf):
+                break
+            end += 1 + size
+            if code == _GAME_END:
+                ended = True
+                break
+
+        decoded = _iter_events(buf, pos, end, payload_sizes, events, base_pos, partial=not ended, **options)
+        while end > pos: # (an `end` of 0 would mean the end of `buf`)
+            try: (event, x, event_pos) = next(decoded)
+            except StopIteration as stop:
+                pos = stop.value
+                break
+            if event is ParseEvent.FRAME:
+                if ParseEvent.FRAME in events:
+                    yield (event, x)
+                if batch is not None:
+                    batch.append(x)
+            elif event is not ParseEvent.RAW or event_pos >= raw_pos:
+                yield (event, x)
+        raw_pos = end
+
+        if batch:
+            yield (ParseEvent.FRAME_BATCH, batch)
+            batch = []
+
+        if ended:
+            if on_game:
+                on_game(None, None)
+            return (buf, base_pos, end)
+
+        buf = buf[pos:] + read()
+        base_pos += pos
+        raw_pos -= pos
+        pos = 0
+
+
+def _follow(input, events, follow, options):
+    if follow is True:
+        follow = Follow()
+
+    if isinstance(input, (str, os.PathLike)):
+        with open(input, 'rb') as f:
+            try: yield from _iter_live(functools.partial(_read_more, f, follow), events, options)
+            except Exception as e: raise _parse_error(e, f)
+    else:
+        try: yield from _iter_live(functools.partial(_read_more, input, follow), events, options)
+        except Exception as e: raise _parse_error(e, input)
+
+
+def _dispatch(input, handlers, events):
+    """Pass `(parse event, object)` pairs from `events` to `handlers`, until a handler raises `StopParsing`."""
+
+    for (event, x) in events:
+        try: handlers[event](x)
+        except StopParsing: return
+        except ParseError: raise
+        except Exception as e:
+            raise _parse_error(ParseError(str(e)), input) from e
+
+
+def _parse_input(input, handlers, skip_frames, parse_events, use_mmap, stats = None):
+    """Parse a replay from any supported kind of input, decoding its events with `parse_events`."""
 
     if isinstance(input, str):
-        _parse_open(pathlib.Path(input), handlers, skip_frames)
+        _parse_open(pathlib.Path(input), handlers, skip_frames, parse_events, use_mmap, stats)
     elif isinstance(input, os.PathLike):
-        _parse_open(input, handlers, skip_frames)
+        _parse_open(input, handlers, skip_frames, parse_events, use_mmap, stats)
     else:
-        _parse_try(input, handlers, skip_frames)
+        _parse_try(input, handlers, skip_frames, parse_events, stats=stats)
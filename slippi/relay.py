@@ -0,0 +1,366 @@
+from __future__ import annotations
+
+import collections, functools, io, os, socket, socketserver, stat, threading
+from typing import BinaryIO, Callable, Deque, List, Optional, Tuple, Union
+
+from .parse import (_FRAME_ID, _FRAME_PRE, _FRAME_START, _GAME_END, _RAW_START, Follow, ParseError, _parse_event_payloads,
+                    _read_more)
+from .stream import Address, _connect, _read_some
+from .util import *
+
+
+class Overflow(Enum):
+    """What a :py:class:`Relay` does when a subscriber's queue is full."""
+
+    BLOCK = 'block' #: Wait for the subscriber to read, holding up the relay (and so every other subscriber)
+    DROP = 'drop' #: Drop the subscriber's oldest queued frames, so it skips ahead
+    DISCONNECT = 'disconnect' #: Close the subscription. Subscribing again catches up from the start of the game.
+
+
+def _split_frames(buf, pos, payload_sizes, lead, current):
+    """Split the complete events in `buf` from `pos` (up to & including any game end) into runs of events, starting a
+    new run at each frame's first event.
+
+    Returns `(runs, end, ended, current)`: `(data, is_frame)` pairs, the end of the last complete event, whether that
+    was the game end, and the frame number of the last frame started."""
+
+    runs = []
+    start = pos
+    ended = False
+    while pos < len(buf):
+        code = buf[pos]
+        try: size = payload_sizes[code]
+        except KeyError: raise ParseError('unexpected event type: 0x%02x' % code)
+        if pos + 1 + size > len(buf):
+            break
+
+        if code == lead:
+            (frame,) = _FRAME_ID.unpack_from(buf, pos + 1)
+            if frame != current:
+                if pos > start:
+                    runs.append((buf[start:pos], current is not None))
+                (start, current) = (pos, frame)
+        elif code == _GAME_END:
+            if pos > start:
+                runs.append((buf[start:pos], current is not None))
+            runs.append((buf[pos:pos + 1 + size], False))
+            (pos, start, ended) = (pos + 1 + size, pos + 1 + size, True)
+            break
+
+        pos += 1 + size
+
+    if pos > start:
+        runs.append((buf[start:pos], current is not None))
+    return (runs, pos, ended, current)
+
+
+def _interrupt(stream, owned):
+    """Make a read of `stream` that's waiting (in another thread) return. A connection is shut down, which ends the
+    read right away; closing a buffered stream wouldn't, as it waits for the read to finish. Other streams are closed,
+    if `owned`."""
+
+    try: fd = stream.fileno()
+    except (AttributeError, OSError, ValueError): fd = None
+    if fd is not None and stat.S_ISSOCK(os.fstat(fd).st_mode):
+        with socket.socket(fileno=os.dup(fd)) as sock:
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass # already disconnected
+    elif owned:
+        stream.close()
+
+
+class Subscription(Base):
+    """A :py:class:`Relay` subscriber's queue of event data.
+
+    Read it like a binary stream: for example, pass it to :py:func:`slippi.stream.iter_stream`. Reads block until
+    there's data, and return `b''` once the relay's source has ended (or the subscription is closed)."""
+
+    queue_size: int #: Most runs of events (about one per frame) to queue before `overflow` applies
+    overflow: Overflow #: What happens when the queue is full
+    dropped: int #: Runs of frame events dropped so far (with `Overflow.DROP`)
+
+    def __init__(self, relay: Relay, queue_size: int, overflow: Overflow):
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.dropped = 0
+        self._relay = relay
+        self._queue: Deque[Tuple[bytes, bool]] = collections.deque()
+        self._pending = b'' # rest of a partly-read run
+        self._ready = threading.Condition()
+        self._closed = False
+        self._finished = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def read1(self, size: int = -1) -> bytes:
+        with self._ready:
+            while not (self._pending or self._queue or self._closed or self._finished):
+                self._ready.wait()
+            if self._closed:
+                return b''
+            if not self._pending and self._queue:
+                self._pending = self._queue.popleft()[0]
+                self._ready.notify_all() # there's room for the relay, if it's waiting
+            if size < 0 or size >= len(self._pending):
+                (data, self._pending) = (self._pending, b'')
+            else:
+                (data, self._pending) = (self._pending[:size], self._pending[size:])
+            return data
+
+    read = read1
+
+    def close(self) -> None:
+        """Stop receiving data."""
+
+        with self._ready:
+            self._closed = True
+            self._queue.clear()
+            self._ready.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _put(self, runs):
+        with self._ready:
+            for run in runs:
+                if self._closed:
+                    return
+                if len(self._queue) >= self.queue_size:
+                    if self.overflow is Overflow.BLOCK:
+                        while len(self._queue) >= self.queue_size and not self._closed:
+                            self._ready.wait()
+                        if self._closed:
+                            return
+                    elif self.overflow is Overflow.DROP:
+                        for (i, (_, is_frame)) in enumerate(self._queue):
+                            if is_frame:
+                                del self._queue[i]
+                                self.dropped += 1
+                                break
+                    else:
+                        self._closed = True
+                        self._queue.clear()
+                        self._ready.notify_all()
+                        return
+                self._queue.append(run)
+            self._ready.notify_all()
+
+    def _finish(self):
+        with self._ready:
+            self._finished = True
+            self._ready.notify_all()
+
+
+class Relay(Base):
+    """Reads one live event source, and fans its events out to any number of subscribers.
+
+    The source is only read & framed once, however many subscribers there are; events are passed on undecoded, as
+    soon as they're complete. Each subscriber has its own bounded queue & overflow policy, so a slow one needn't hold
+    up the rest. Subscribers that join mid-game first get the game so far, from its start; those that join between
+    games start with the next one.
+
+    Use as a context manager, or call :py:meth:`start` & :py:meth:`close`."""
+
+    queue_size: int #: Default queue size for subscriptions
+    overflow: Overflow #: Default overflow policy for subscriptions
+    error: Optional[Exception] #: What ended the source early, if anything
+
+    def __init__(self, source: Union[str, os.PathLike, Address, Callable[[], BinaryIO], socket.socket, BinaryIO],
+                 queue_size: int = 1024, overflow: Overflow = Overflow.DROP, follow: Optional[Follow] = None):
+        """:param source: a replay file being written (path), or a live event stream: `(host, port)` address, a function that opens the stream, a connected socket, or a binary file object
+        :param queue_size: default queue size for subscriptions, in runs of events (about one per frame)
+        :param overflow: default overflow policy for subscriptions
+        :param follow: how to wait for more of a replay file (see :py:class:`slippi.parse.Follow`)"""
+
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.error = None
+        self._source = source
+        self._follow = follow or Follow()
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        self._history: List[bytes] = [] # the current game so far
+        self._finished = False
+        self._closing = False
+        self._stream: Optional[Tuple[BinaryIO, bool]] = None # the source, & whether the relay opened it
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+
+    def subscribe(self, queue_size: Optional[int] = None, overflow: Optional[Overflow] = None) -> Subscription:
+        """Subscribe to the source's events, starting from the start of the current game (if any).
+
+        :param queue_size: queue size for this subscription (default :py:attr:`queue_size`)
+        :param overflow: overflow policy for this subscription (default :py:attr:`overflow`)"""
+
+        subscription = Subscription(self, queue_size or self.queue_size, overflow or self.overflow)
+        with self._lock:
+            if self._history:
+                # catching up isn't limited by the queue size
+                subscription._queue.append((b''.join(self._history), False))
+            if self._finished:
+                subscription._finish()
+            else:
+                self._subscribers.append(subscription)
+        return subscription
+
+    def serve(self, address: Address = ('127.0.0.1', 0)) -> Address:
+        """Also fan events out over TCP: each connection gets its own subscription (with the default queue size &
+        overflow policy). Returns the address served on.
+
+        :param address: address to listen on (port 0 picks a free port)"""
+
+        relay = self
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with relay.subscribe() as subscription:
+                    try:
+                        for data in iter(subscription.read1, b''):
+                            self.request.sendall(data)
+                    except OSError: # the client went away
+                        pass
+
+        self._server = socketserver.ThreadingTCPServer(address, Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.socket.getsockname()[:2]
+
+    def start(self) -> Relay:
+        """Start reading the source, in a background thread."""
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the source to end."""
+
+        if self._thread:
+            self._thread.join(timeout)
+
+    def close(self) -> None:
+        """Stop reading the source & serving over TCP, and end every subscription. Returns once the source is closed.
+
+        A read that's waiting for data from a connection is cut short, as is following a replay file. But if the source
+        is some other kind of file object that you opened (such as a pipe), a read that's waiting on it isn't."""
+
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            self._closing = True
+            (subscribers, self._subscribers) = (self._subscribers, [])
+            stream = self._stream
+        # (subscriptions first, in case the source is waiting for room in one)
+        for subscription in subscribers:
+            subscription.close()
+        if stream:
+            _interrupt(*stream)
+        self.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _publish(self, runs, new_game = False, ended = False):
+        with self._lock:
+            if new_game:
+                self._history = []
+            if ended: # later subscribers start with the next game
+                self._history = []
+            else:
+                self._history.extend(data for (data, _) in runs)
+            self._subscribers = [s for s in self._subscribers if not s.closed]
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._put(runs)
+
+    def _open(self):
+        """Open the source, returning a function to read more of it, whether it's a single game, the stream, & whether
+        the relay opened it (so should close it)."""
+
+        source = self._source
+        if isinstance(source, (str, os.PathLike)):
+            f = open(source, 'rb')
+            return (functools.partial(_read_more, f, self._follow), True, f, True)
+        if isinstance(source, tuple):
+            stream = _connect(source)
+        elif callable(source):
+            stream = source()
+        elif isinstance(source, socket.socket):
+            stream = source.makefile('rb')
+        else:
+            return (functools.partial(_read_some, source), False, source, False)
+        return (functools.partial(_read_some, stream), False, stream, True)
+
+    def _run(self):
+        try: (read, single_game, stream, owned) = self._open()
+        except Exception as e:
+            self._end(e)
+            return
+
+        with self._lock:
+            closing = self._closing
+            self._stream = (stream, owned)
+        try:
+            if not closing:
+                self._relay(read, single_game)
+        except Exception as e:
+            self._end(e)
+        else:
+            self._end(None)
+        finally:
+            if owned:
+                stream.close()
+
+    def _relay(self, read, single_game):
+        """Read, frame & publish the source's events, until it ends."""
+
+        buf = b''
+        if single_game: # a replay file: skip its UBJSON wrapper
+            while len(buf) < _RAW_START:
+                buf += read()
+            expect_bytes(b'{U\x03raw[$U#l', io.BytesIO(buf))
+            buf = buf[_RAW_START:]
+
+        (pos, payload_sizes, lead, current) = (0, None, None, None)
+        while True:
+            if payload_sizes is None:
+                if len(buf) - pos >= 2 and len(buf) - pos >= 1 + buf[pos + 1]:
+                    (size, payload_sizes) = _parse_event_payloads(buf, pos)
+                    lead = _FRAME_START if _FRAME_START in payload_sizes else _FRAME_PRE
+                    current = None
+                    self._publish([(buf[pos:pos + size], False)], new_game=True)
+                    pos += size
+                    continue
+            else:
+                (runs, pos, ended, current) = _split_frames(buf, pos, payload_sizes, lead, current)
+                if runs:
+                    self._publish(runs, ended=ended)
+                if ended:
+                    payload_sizes = None
+                    if single_game:
+                        break
+                    continue
+
+            try: data = read()
+            except EOFError:
+                if payload_sizes is not None or pos < len(buf):
+                    raise
+                break
+            (buf, pos) = (buf[pos:] + data, 0)
+
+    def _end(self, error):
+        with self._lock:
+            if not self._closing: # (closing the source may well make reading it fail)
+                self.error = error
+            self._finished = True
+            subscribers = self._subscribers
+        for subscription in subscribers:
+            subscription._finish()
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import functools, os, socket, socketserver, threading, time
+from typing import Any, BinaryIO, Callable, Collection, Dict, Iterator, List, Optional, Tuple, Union
+
+from .event import EventType
+from .parse import (_FRAME_ID, _FRAME_PRE, _FRAME_START, _GAME_END, ParseError, ParseEvent, _dispatch, _event_options,
+                    _iter_live, _parse_error, _parse_event_payloads, _read_raw)
+from .util import *
+
+
+Address = Tuple[str, int]
+
+# Event streams (as opposed to replay files) can hold any number of games, and never have metadata.
+_STREAM_EVENTS = frozenset((ParseEvent.START, ParseEvent.FRAME, ParseEvent.FRAME_BATCH, ParseEvent.END, ParseEvent.RAW))
+
+
+class Reconnect(Base):
+    """How to reconnect to an event stream that drops mid-game (see :py:func:`iter_stream`).
+
+    Reconnection is retried, waiting `interval` seconds at first and doubling the wait each time (up to
+    `max_interval`). The stream must then resend the current game from its start (as a relay does for new
+    connections); what was already received is skipped, so parsing resumes exactly where it left off."""
+
+    interval: float #: Initial wait before reconnecting, in seconds
+    max_interval: float #: Longest wait between attempts, in seconds
+    timeout: Optional[float] #: Give up after this many seconds without a connection (None to keep trying forever)
+
+    def __init__(self, interval: float = 0.1, max_interval: float = 2.0, timeout: Optional[float] = 30.0):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+
+
+def _connect(address):
+    sock = socket.create_connection(address)
+    try: return sock.makefile('rb')
+    finally: sock.close() # the file keeps the connection open until it's closed
+
+
+def _read_some(stream):
+    """Read whatever's available from `stream` (blocking until something is), raising `EOFError` at its end."""
+
+    data = getattr(stream, 'read1', stream.read)(1 << 16)
+    if not data:
+        raise EOFError()
+    return data
+
+
+class _Reconnecting:
+    """A `read` function (for `_iter_live`) over a stream that's reopened by `connect` when it drops mid-game."""
+
+    def __init__(self, connect, reconnect):
+        self._connect = connect
+        self._reconnect = reconnect
+        self._stream = connect()
+        self._received = 0 # bytes received, across connections
+        self._game = None # stream position & first bytes of the current game
+
+    def game(self, pos, prefix):
+        self._game = None if pos is None else (pos, prefix)
+
+    def close(self):
+        self._stream.close()
+
+    def __call__(self):
+        while True:
+            try:
+                data = _read_some(self._stream)
+                self._received += len(data)
+                return data
+            except (EOFError, OSError):
+                if self._game is None: # between games, so the stream just ended
+                    raise EOFError()
+                data = self._resume()
+                if data:
+                    return data
+
+    def _resume(self):
+        """Reconnect, skip the part of the current game that was already received, and return any data after it."""
+
+        (pos, prefix) = self._game
+        skip = self._received - pos
+        interval = self._reconnect.interval
+        since = time.monotonic()
+        while True:
+            self._stream.close()
+            try:
+                self._stream = self._connect()
+                data = b''
+                while len(data) < skip:
+                    data += _read_some(self._stream)
+                    if not prefix.startswith(data[:len(prefix)]):
+                        raise ParseError('reconnected to a different game', pos = pos)
+                data = data[skip:]
+                self._received += len(data)
+                return data
+            except ParseError: # (an `OSError`, but not one that reconnecting will fix)
+                raise
+            except (EOFError, OSError):
+                pass
+
+            if self._reconnect.timeout is not None and time.monotonic() - since >= self._reconnect.timeout:
+                raise ParseError('timed out reconnecting', pos = self._received)
+            time.sleep(interval)
+            interval = min(2 * interval, self._reconnect.max_interval)
+
+
+def iter_stream(source: Union[Address, Callable[[], BinaryIO], socket.socket, BinaryIO],
+                events: Collection[ParseEvent] = (ParseEvent.START, ParseEvent.FRAME, ParseEvent.END),
+                reconnect: Optional[Reconnect] = None, event_types: Optional[Collection[EventType]] = None,
+                ports: Optional[Collection[int]] = None, followers: bool = True,
+                pre_fields: Optional[Collection[str]] = None,
+                post_fields: Optional[Collection[str]] = None) -> Iterator[Tuple[ParseEvent, Any]]:
+    """Parse a live stream of Slippi events (as relayed from a console), generating `(parse event, object)` pairs.
+
+    Unlike a replay file, the stream has no UBJSON wrapper or metadata: each game starts with its event payloads, and
+    games follow one another until the stream ends. Events are parsed as soon as they've been received, and frames
+    generated as soon as they're complete (see :py:func:`slippi.parse.iter_events`).
+
+    :param source: `(host, port)` address to connect to, a function that opens the stream, a connected socket, or a binary file object
+    :param events: parse events to generate: any of `START`, `FRAME`, `FRAME_BATCH` (the frames completed by each read), `END` and `RAW`
+    :param reconnect: if given, reconnect when the stream drops mid-game (see :py:class:`Reconnect`). Requires `source` to be an address or a function.
+    :param event_types: types of events to decode (see :py:func:`slippi.parse.parse`)
+    :param ports: ports whose pre- & post-frame data to decode (see :py:func:`slippi.parse.parse`)
+    :param followers: when false, skip pre- & post-frame data for followers (Nana)
+    :param pre_fields: pre-frame attributes to decode (see :py:func:`slippi.parse.parse`)
+    :param post_fields: post-frame attributes to decode (see :py:func:`slippi.parse.parse`)"""
+
+    events = frozenset(events)
+    if not events <= _STREAM_EVENTS:
+        raise ValueError(f'unsupported parse events for a stream: {set(events - _STREAM_EVENTS)}')
+    options = _event_options(event_types, ports, followers, pre_fields, post_fields)
+
+    connect: Callable[[], BinaryIO]
+    read: Callable[[], bytes]
+    stream: Union[BinaryIO, _Reconnecting]
+    if isinstance(source, tuple):
+        connect = functools.partial(_connect, source)
+    elif callable(source):
+        connect = source
+    elif reconnect:
+        raise ValueError('reconnecting requires an address or a function to open the stream')
+    elif isinstance(source, socket.socket):
+        sock = source # (a lambda wouldn't see `source` narrowed to a socket)
+        connect = lambda: sock.makefile('rb')
+    else:
+        opened = source
+        connect = lambda: opened
+
+    if reconnect:
+        read = _Reconnecting(connect, reconnect)
+        (stream, on_game) = (read, read.game)
+    else:
+        stream = connect()
+        (read, on_game) = (functools.partial(_read_some, stream), None)
+
+    try:
+        yield from _iter_live(read, events, options, raw=True, on_game=on_game)
+    except Exception as e:
+        raise _parse_error(e, source)
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+def parse_stream(source: Union[Address, Callable[[], BinaryIO], socket.socket, BinaryIO],
+                 handlers: Dict[ParseEvent, Callable[..., None]], reconnect: Optional[Reconnect] = None,
+                 event_types: Optional[Collection[EventType]] = None, ports: Optional[Collection[int]] = None,
+                 followers: bool = True, pre_fields: Optional[Collection[str]] = None,
+                 post_fields: Optional[Collection[str]] = None) -> None:
+    """Parse a live stream of Slippi events, passing them to `handlers` as they arrive (see :py:func:`iter_stream`).
+    A handler can raise :py:class:`slippi.parse.StopParsing` to stop.
+
+    :param source: `(host, port)` address to connect to, a function that opens the stream, a connected socket, or a binary file object
+    :param handlers: dict of parse event keys (`START`, `FRAME`, `FRAME_BATCH`, `END` and/or `RAW`) to handler functions
+    :param reconnect: if given, reconnect when the stream drops mid-game (see :py:class:`Reconnect`)"""
+
+    _dispatch(source, handlers, iter_stream(source, handlers.keys(), reconnect, event_types, ports, followers,
+                                            pre_fields, post_fields))
+
+
+def _frame_chunks(raw):
+    """Split a replay's `raw` element into its events before the first frame, each frame's events (in the order they
+    were sent, so including rollbacks), and the game end."""
+
+    (pos, payload_sizes) = _parse_event_payloads(raw)
+    lead = _FRAME_START if _FRAME_START in payload_sizes else _FRAME_PRE
+    cuts = [0]
+    current = None
+    while pos < len(raw):
+        code = raw[pos]
+        if code == lead:
+            (frame,) = _FRAME_ID.unpack_from(raw, pos + 1)
+            if frame != current:
+                cuts.append(pos)
+                current = frame
+        elif code == _GAME_END:
+            cuts.append(pos)
+            pos += 1 + payload_sizes[code]
+            break
+        pos += 1 + payload_sizes[code]
+    cuts.append(pos)
+    return [bytes(raw[start:end]) for (start, end) in zip(cuts, cuts[1:])]
+
+
+class ReplayServer(Base):
+    """A stand-in for a console relay, for testing stream ingest offline: serves the events of replay files over TCP,
+    as :py:func:`iter_stream` expects them.
+
+    With a frame rate, the replays are played back in turn, one frame at a time, as if live. A client gets the
+    current game from its start, then each frame as it's played, until the last replay ends. Without one, each
+    client gets all the replays, as fast as it can read them. Either way, games are sent in full; the server closes
+    connections when it has nothing more to send.
+
+    Use as a context manager, or call :py:meth:`start` & :py:meth:`close`."""
+
+    address: Address #: Address the server is listening on
+    fps: Optional[float] #: Frames played per second (60 is real time), or None to send everything at once
+
+    def __init__(self, replays: Union[str, os.PathLike, Collection[Union[str, os.PathLike]]],
+                 address: Address = ('127.0.0.1', 0), fps: Optional[float] = 60.0, drop_after: Optional[int] = None):
+        """:param replays: replay path(s) to serve
+        :param address: address to listen on (port 0 picks a free port)
+        :param fps: frames to play per second, or None to send each client everything at once
+        :param drop_after: if given, drop the first connection after sending it this many bytes, to test reconnects"""
+
+        if isinstance(replays, (str, os.PathLike)):
+            replays = [replays]
+        self._games: List[List[bytes]] = []
+        for replay in replays:
+            with open(replay, 'rb') as f:
+                self._games.append(_frame_chunks(_read_raw(f, False)[0]))
+
+        self.fps = fps
+        self._drop_after = drop_after
+        self._progress = (0, 0) # game being played, & how many of its chunks have been
+        self._played = threading.Condition()
+        self._closed = False
+
+        server = self
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._serve(self.request)
+
+        self._server = socketserver.ThreadingTCPServer(address, Handler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self.address = self._server.socket.getsockname()[:2]
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> ReplayServer:
+        """Start serving (and playing back the replays), in background threads."""
+
+        self._threads.append(threading.Thread(target=self._server.serve_forever, daemon=True))
+        if self.fps:
+            self._threads.append(threading.Thread(target=self._play, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop serving, and close the listening socket."""
+
+        with self._played:
+            self._closed = True
+            self._played.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _play(self):
+        interval = 1 / self.fps
+        next_time = time.monotonic()
+        for (game, chunks) in enumerate(self._games):
+            for i in range(len(chunks)):
+                with self._played:
+                    if self._closed:
+                        return
+                    self._progress = (game, i + 1)
+                    self._played.notify_all()
+                next_time += interval
+                time.sleep(max(0, next_time - time.monotonic()))
+
+    def _chunks(self):
+        """The chunks of data to send a new client."""
+
+        if not self.fps:
+            for chunks in self._games:
+                yield from chunks
+            return
+
+        with self._played:
+            (game, sent) = (self._progress[0], 0)
+        while game < len(self._games):
+            with self._played:
+                while self._progress == (game, sent) and not self._closed:
+                    self._played.wait()
+                if self._closed:
+                    return
+                (playing, played) = self._progress
+            chunks = self._games[game]
+            available = played if playing == game else len(chunks)
+            yield from chunks[sent:available]
+            sent = available
+            if sent == len(chunks):
+                (game, sent) = (game + 1, 0)
+
+    def _serve(self, conn):
+        with self._played:
+            drop_after = self._drop_after
+            self._drop_after = None
+        try:
+            for chunk in self._chunks():
+                if drop_after is not None:
+                    if len(chunk) >= drop_after:
+                        conn.sendall(chunk[:drop_after])
+                        return
+                    drop_after -= len(chunk)
+                conn.sendall(chunk)
+        except OSError: # the client went away
+            pass
@@ -1,4 +1,5 @@
 import enum
+import functools
 import os
 import re
 import struct
@@ -39,17 +40,90 @@ def try_enum(enum_type, val):
     try:
         return enum_type(val)
     except ValueError:
-        log.info('unknown %s: %s' % (enum_type.__name__, val))
+        log.info('unknown %s: %s', enum_type.__name__, val)
         return val
 
 
+@functools.lru_cache(maxsize=None)
+def _struct(fmt):
+    return struct.Struct('>' + fmt)
+
+
+def enum_table(enum_type):
+    """Precompute a lookup of raw values to members of `enum_type`.
+
+    Decoders convert with `table.get(val, val)`, which (unlike `try_enum`) neither raises nor logs for values that aren't
+    members, such as character-specific action states."""
+
+    return {member.value: member for member in enum_type}
+
+
 def unpack(fmt, stream):
-    fmt = '>' + fmt
-    size = struct.calcsize(fmt)
-    bytes = stream.read(size)
+    s = _struct(fmt)
+    bytes = stream.read(s.size)
     if not bytes:
         raise EOFError()
-    return struct.unpack(fmt, bytes)
+    return s.unpack(bytes)
+
+
+def versioned_struct(offset, segments, size):
+    """Build a decoder for an event payload whose fields were appended over successive replay versions.
+
+    :param offset: position of the first field within the payload
+    :param segments: struct formats for each group of fields, oldest first
+    :param size: payload size, as given by the replay's event payloads table
+    :returns: a single big-endian struct covering every field group that fits in `size`, and a tuple of `None`s to pad its output out to the number of fields in the newest version"""
+
+    fmt = '>'
+    end = offset
+    missing = 0
+    for segment in segments:
+        s = _struct(segment)
+        if end + s.size <= size:
+            fmt += segment
+            end += s.size
+        else:
+            missing += len(s.unpack(bytes(s.size)))
+    return (struct.Struct(fmt), (None,) * missing)
+
+
+_FIELD = re.compile(r'(\d*)([xcbB?hHiIlLqQefds])')
+
+def projected_struct(offset, segments, size, wanted):
+    """Like `versioned_struct`, but only decoding some of the fields: the rest are skipped over as pad bytes.
+
+    :param wanted: indices of the fields to decode, counting every field of every segment (a `'16s'` is one field)
+    :returns: a big-endian struct yielding the wanted fields in index order, and a tuple of `None`s to pad its output for wanted fields that are too new to fit in `size`"""
+
+    fmt = '>'
+    skip = 0
+    end = offset
+    missing = 0
+    index = 0
+    present = True
+    for segment in segments:
+        seg_size = _struct(segment).size
+        present = present and end + seg_size <= size
+        end += seg_size
+        for (count, code) in _FIELD.findall(segment):
+            count = int(count or 1)
+            if code == 'x':
+                skip += count
+                continue
+            elif code == 's':
+                (width, count, code) = (count, 1, '%ds' % count)
+            else:
+                width = _struct(code).size
+            for _ in range(count):
+                if index not in wanted:
+                    skip += width
+                elif present:
+                    fmt += ('%dx' % skip if skip else '') + code
+                    skip = 0
+                else:
+                    missing += 1
+                index += 1
+    return (struct.Struct(fmt), (None,) * missing)
 
 
 def expect_bytes(expected_bytes, stream):
@@ -59,7 +133,8 @@ def expect_bytes(expected_bytes, stream):
 
 
 class Base:
-    # __slots__: Tuple = ()
+    # Subclasses that declare `__slots__` get no per-instance `__dict__`
+    __slots__ = ()
 
     def _attr_repr(self, attr):
         return attr + '=' + _format(getattr(self, attr))
@@ -67,8 +142,8 @@ class Base:
     def __repr__(self):
         attrs = []
         for attr in dir(self):
-            # uppercase names are nested classes
-            if not callable(getattr(self, attr)) and not (attr.startswith('_') or attr[0].isupper()):
+            # uppercase names are nested classes; unset slots are left out
+            if hasattr(self, attr) and not callable(getattr(self, attr)) and not (attr.startswith('_') or attr[0].isupper()):
                 s = self._attr_repr(attr)
                 if s:
                     attrs.append(_indent(s))
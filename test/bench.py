@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""Parser benchmarks over the replays in test/replays. Run with `python -m test.bench`."""
+
+import glob, os, timeit, tracemalloc
+
+from slippi import Game
+from slippi.enums import ActionState, Attack
+from slippi.util import enum_table, try_enum
+
+
+REPLAYS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'replays', '*.slp')))
+MODERN_REPLAYS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'Modern Replays', '*.slp')))
+
+
+def decode_all():
+    """Parse every replay and decode all pre- & post-frame data."""
+    for replay in REPLAYS:
+        for frame in Game(replay).frames:
+            for port in frame.ports:
+                if port:
+                    port.leader.pre
+                    port.leader.post
+
+
+def bench_decode(number = 3):
+    print('decode all replays: %.3fs' % min(timeit.repeat(decode_all, number=1, repeat=number)))
+
+
+def decode_projected():
+    """Parse every replay, decoding just the post-frame state & percent."""
+    for replay in REPLAYS:
+        for frame in Game(replay, pre_fields=(), post_fields={'state', 'percent'}).frames:
+            for port in frame.ports:
+                if port:
+                    port.leader.post
+
+
+def bench_projection(number = 3):
+    print('decode all replays, post-frame state & percent only: %.3fs' % min(timeit.repeat(decode_projected, number=1, repeat=number)))
+
+
+def bench_columnar(number = 3):
+    """Compare bulk & per-event decoding into :py:class:`slippi.columnar.ColumnarGame`."""
+    from slippi.columnar import ColumnarGame
+    for bulk in (False, True):
+        t = min(timeit.repeat(lambda: [ColumnarGame(replay, bulk=bulk) for replay in REPLAYS], number=1, repeat=number))
+        print('columnar, %s: %.3fs' % ('bulk' if bulk else 'per event', t))
+
+
+def bench_memory(replays = MODERN_REPLAYS):
+    """Memory held per frame by fully-decoded games, for modern (3.0.0+) replays (by default, the `Modern Replays` corpus)."""
+    for replay in replays:
+        if Game(replay, skip_frames=True).start.slippi < '3.0.0':
+            continue
+        tracemalloc.start()
+        game = Game(replay)
+        for frame in game.frames:
+            for port in frame.ports:
+                if port:
+                    for data in (port.leader, port.follower):
+                        if data:
+                            data.pre
+                            data.post
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%s: %d frames, %d bytes/frame' % (os.path.basename(replay), len(game.frames), size // len(game.frames)))
+
+
+def bench_enums(number = 10):
+    """Compare `try_enum` against `enum_table` lookups, for the action states & attacks that actually occur in the test replays."""
+
+    states = []
+    attacks = []
+    for replay in REPLAYS:
+        for frame in Game(replay).frames:
+            for port in frame.ports:
+                if port:
+                    states.append(int(port.leader.post.state))
+                    attacks.append(int(port.leader.post.most_recent_hit))
+
+    action_states = enum_table(ActionState)
+    attack_table = enum_table(Attack)
+    for (name, values, enum_type, table) in (('ActionState', states, ActionState, action_states), ('Attack', attacks, Attack, attack_table)):
+        t_try = min(timeit.repeat(lambda: [try_enum(enum_type, v) for v in values], number=1, repeat=number))
+        t_table = min(timeit.repeat(lambda: [table.get(v, v) for v in values], number=1, repeat=number))
+        print('%s (%d values): try_enum %.3fs, enum_table %.3fs (%.1fx)' % (name, len(values), t_try, t_table, t_try / t_table))
+
+
+if __name__ == '__main__':
+    bench_enums()
+    bench_decode()
+    bench_projection()
+    bench_columnar()
+    bench_memory()
@@ -1,13 +1,16 @@
 #!/usr/bin/python3
 
-import datetime, glob, os, subprocess, unittest
+import datetime, glob, io, itertools, os, pickle, struct, subprocess, tempfile, threading, time, unittest
 
-from slippi import Game, parse
-from slippi.enums.state import CSSCharacter, InGameCharacter, Item, Stage
+from slippi import FrameIndex, Follow, Game, IndexedGame, ParseStats, iter_events, iter_frames, parse, peek, peek_dir
+from slippi.columnar import ColumnarGame
+from slippi.enums import CSSCharacter, InGameCharacter, Item, Stage
 from slippi.log import log
 from slippi.metadata import Metadata
-from slippi.event import Buttons, Direction, End, Frame, Position, Start, Triggers, Velocity
-from slippi.parse import ParseEvent
+from slippi.event import Buttons, Direction, End, EventType, Frame, Position, Start, Triggers, Velocity
+from slippi.parse import ParseError, ParseEvent, StopParsing
+from slippi.relay import Overflow, Relay
+from slippi.stream import Reconnect, ReplayServer, iter_stream, parse_stream
 
 
 BPhys = Buttons.Physical
@@ -78,6 +81,8 @@ class TestGame(unittest.TestCase):
         self.assertEqual(game.metadata.players, (None, None, None, None))
         self.assertEqual(game.start.players[0].character, CSSCharacter.FOX)
         self.assertEqual(game.start.players[1].character, CSSCharacter.GANONDORF)
+        self.assertIsNone(game.start.players[0].tag) # tags were added in v1.3.0
+        self.assertIsNone(game.start.is_pal)
 
     def test_game(self):
         game = self._game('game')
@@ -277,6 +282,89 @@ class TestGame(unittest.TestCase):
                 velocity=Velocity(0.0, 0.0))})
 
 
+class TestColumnarGame(unittest.TestCase):
+    def test_columnar(self):
+        game = Game(path('v3.14.0'))
+        columnar = ColumnarGame(path('v3.14.0'))
+        self.assertEqual(columnar.start, game.start)
+        self.assertEqual(len(columnar.frames), len(game.frames))
+        self.assertEqual(columnar.ports[2:], (None, None))
+
+        post = game.frames[1000].ports[1].leader.post
+        row = columnar.ports[1].leader.post[1000]
+        self.assertEqual(row['state'], post.state)
+        self.assertEqual(row['position_x'], post.position.x)
+        self.assertEqual(row['flags'], post.flags)
+        self.assertEqual(row['animation_index'], post.animation_index)
+        self.assertFalse(columnar.ports[1].leader.mask.any())
+
+    def test_columnar_ics(self):
+        columnar = ColumnarGame(path('ics'))
+        game = Game(path('ics'))
+        self.assertIsNotNone(columnar.ports[0].follower)
+        self.assertEqual(columnar.ports[0].follower.pre[0]['buttons_logical'], game.frames[0].ports[0].follower.pre.buttons.logical)
+
+    def test_columnar_items(self):
+        columnar = ColumnarGame(path('items'))
+        game = Game(path('items'))
+        self.assertEqual(len(columnar.items), sum(len(f.items) for f in game.frames))
+        self.assertEqual(set(columnar.items['spawn_id']), {0, 1, 2})
+
+    def test_columnar_bulk(self):
+        for replay in ('v0.1', 'ics', 'items'):
+            bulk = ColumnarGame(path(replay))
+            each = ColumnarGame(path(replay), bulk=False)
+            self.assertTrue((bulk.frames == each.frames).all())
+            self.assertTrue((bulk.items == each.items).all())
+            for (port, expected) in zip(bulk.ports, each.ports):
+                self.assertEqual(port is None, expected is None)
+                if port:
+                    self.assertTrue((port.leader.pre == expected.leader.pre).all())
+                    self.assertTrue((port.leader.post == expected.leader.post).all())
+                    self.assertTrue((port.leader.mask == expected.leader.mask).all())
+
+
+class TestIndexedGame(unittest.TestCase):
+    def test_frame_at(self):
+        game = Game(path('v3.14.0'))
+        indexed = IndexedGame(path('v3.14.0'))
+        self.assertEqual(len(indexed), len(game.frames))
+        self.assertEqual(indexed.start, game.start)
+        self.assertEqual(indexed.metadata, game.metadata)
+        for i in (0, 5000, -1):
+            self.assertEqual(indexed.frame_at(i).index, game.frames[i].index)
+            self.assertEqual(indexed.frame_at(i).ports[0].leader.post.position, game.frames[i].ports[0].leader.post.position)
+        self.assertEqual([f.index for f in indexed[100:103]], [f.index for f in game.frames[100:103]])
+
+    def test_save_load(self):
+        index = FrameIndex.build(path('items'))
+        with tempfile.TemporaryDirectory() as d:
+            index.save(os.path.join(d, 'items.slp.idx'))
+            loaded = FrameIndex.load(os.path.join(d, 'items.slp.idx'))
+        self.assertEqual(loaded.frames, index.frames)
+        self.assertEqual(loaded.rollbacks, index.rollbacks)
+        self.assertEqual(loaded.replay_size, os.path.getsize(path('items')))
+
+    def test_in_progress(self):
+        game = Game(path('v3.14.0'))
+        with open(path('v3.14.0'), 'rb') as f:
+            data = f.read()
+        (length,) = struct.unpack('>l', data[11:15])
+        with tempfile.TemporaryDirectory() as d:
+            # still being written (no length yet), and finished but without its length & metadata written
+            for (name, cut) in (('partial.slp', 200000), ('ended.slp', 15 + length)):
+                replay = os.path.join(d, name)
+                with open(replay, 'wb') as f:
+                    f.write(data[:11] + b'\0\0\0\0' + data[15:cut])
+                indexed = IndexedGame(replay)
+                self.assertEqual(indexed.start, game.start)
+                self.assertIsNone(indexed.metadata)
+                self.assertEqual(len(indexed), len(FrameIndex.build(replay)))
+                self.assertEqual(indexed.frame_at(10).ports[0].leader.post.position, game.frames[10].ports[0].leader.post.position)
+                self.assertEqual(indexed.end, None if cut == 200000 else game.end)
+                del indexed # release the mapping, so the file can be removed
+
+
 class TestParse(unittest.TestCase):
     def test_parse(self):
         metadata = None
@@ -286,6 +374,512 @@ class TestParse(unittest.TestCase):
         parse(path('game'), {ParseEvent.METADATA: set_metadata})
         self.assertEqual(metadata.duration, 5209)
 
+    def test_parse_event_types(self):
+        game = Game(path('items'), event_types={EventType.GAME_START, EventType.FRAME_POST})
+        full = Game(path('items'))
+        self.assertEqual(game.start, full.start)
+        self.assertIsNone(game.end)
+        self.assertEqual(len(game.frames), len(full.frames))
+        frame = game.frames[-1]
+        self.assertEqual(frame.items, ())
+        self.assertIsNone(frame.ports[0].leader.pre)
+        self.assertEqual(frame.ports[0].leader.post.position, full.frames[-1].ports[0].leader.post.position)
+
+    def test_parse_ports(self):
+        game = Game(path('v3.14.0'), ports={1})
+        full = Game(path('v3.14.0'))
+        self.assertEqual(len(game.frames), len(full.frames))
+        self.assertIsNone(game.frames[0].ports[0])
+        self.assertEqual(game.frames[-1].ports[1].leader.post.percent, full.frames[-1].ports[1].leader.post.percent)
+
+    def test_parse_no_followers(self):
+        game = Game(path('ics'), followers=False)
+        self.assertIsNone(game.frames[0].ports[0].follower)
+        self.assertIsNotNone(game.frames[0].ports[0].leader.post)
+
+    def test_parse_fields(self):
+        game = Game(path('v3.14.0'), pre_fields={'buttons'}, post_fields={'state', 'percent', 'self_air_speed'})
+        full = Game(path('v3.14.0'))
+        (post, full_post) = (game.frames[-1].ports[0].leader.post, full.frames[-1].ports[0].leader.post)
+        self.assertEqual(post.state, full_post.state)
+        self.assertEqual(post.percent, full_post.percent)
+        self.assertEqual(post.self_air_speed, full_post.self_air_speed)
+        self.assertEqual(game.frames[-1].ports[0].leader.pre.buttons, full.frames[-1].ports[0].leader.pre.buttons)
+        with self.assertRaises(AttributeError):
+            post.position
+        with self.assertRaises(AttributeError):
+            game.frames[-1].ports[0].leader.pre.state
+
+    def test_parse_fields_old_version(self):
+        game = Game(path('v0.1'), post_fields={'state', 'hitlag_remaining'})
+        self.assertIsNone(game.frames[0].ports[0].leader.post.hitlag_remaining)
+
+    def test_parse_fields_unknown(self):
+        with self.assertRaises(ParseError):
+            Game(path('v3.14.0'), post_fields={'damage'})
+
+    def test_parse_stats(self):
+        stats = ParseStats()
+        game = Game(path('v3.14.0'), parse_stats=stats)
+        self.assertIs(game.parse_stats, stats)
+        self.assertEqual(stats.replays, 1)
+        self.assertEqual(stats.frames, len(game.frames))
+        self.assertEqual(stats.rollbacks, 0)
+        self.assertEqual(stats.event_counts[EventType.GAME_START], 1)
+        self.assertEqual(stats.event_counts[EventType.FRAME_PRE], sum(1 for f in game.frames for p in f.ports if p))
+        self.assertEqual(stats.event_bytes[EventType.GAME_END], 7) # code + method, LRAS initiator & 4 placements
+        self.assertGreater(stats.decode_time, 0)
+
+        Game(path('items'), parse_stats=stats)
+        total = ParseStats() + Game(path('v3.14.0'), parse_stats=ParseStats()).parse_stats
+        self.assertEqual(stats.replays, 2)
+        self.assertEqual(total.frames, len(game.frames))
+        self.assertEqual((total + stats).replays, 3)
+        self.assertIsNone(Game(path('v3.14.0')).parse_stats)
+
+    def test_parse_frame_batch(self):
+        frames = []
+        batches = []
+        parse(path('v3.14.0'), {
+            ParseEvent.FRAME: frames.append,
+            ParseEvent.FRAME_BATCH: batches.append}, frame_batch_size=5000)
+        self.assertEqual([len(b) for b in batches], [5000, 5000, len(frames) - 10000])
+        self.assertEqual([f.index for b in batches for f in b], [f.index for f in frames])
+
+    def test_parse_frame_range(self):
+        game = Game(path('v3.14.0'))
+        ranged = Game(path('v3.14.0'), frame_range=(100, 200))
+        self.assertEqual([f.index for f in ranged.frames], list(range(100, 201)))
+        self.assertEqual(ranged.frames[50].ports[0].leader.post.position, game.frames[150 + 123].ports[0].leader.post.position)
+        self.assertEqual(ranged.start, game.start)
+        self.assertEqual(ranged.end.method, game.end.method)
+        self.assertEqual(ranged.metadata, game.metadata)
+
+        self.assertEqual(len(Game(path('v3.14.0'), frame_range=(None, 0)).frames), 124)
+        self.assertEqual([f.index for f in iter_frames(path('v3.14.0'), frame_range=(10, 12))], [10, 11, 12])
+
+    def test_parse_stop(self):
+        frames = []
+        def on_frame(frame):
+            frames.append(frame)
+            if len(frames) == 100:
+                raise StopParsing()
+
+        ends = []
+        metadata = []
+        parse(path('v3.14.0'), {
+            ParseEvent.FRAME: on_frame,
+            ParseEvent.END: ends.append,
+            ParseEvent.METADATA: metadata.append})
+        self.assertEqual(len(frames), 100)
+        self.assertEqual(len(ends), 1)
+        self.assertEqual(metadata, [Game(path('v3.14.0'), skip_frames=True).metadata])
+
+    def test_parse_skip_rollbacks(self):
+        # re-send the previous two frames after every tenth frame, as a rollback would
+        with open(path('v3.14.0'), 'rb') as f:
+            data = f.read()
+        (length,) = struct.unpack_from('>l', data, 11)
+        raw = data[15:15 + length]
+        index = FrameIndex.build(path('v3.14.0'))
+        spans = [(index.frames[2 * i], index.frames[2 * i + 1]) for i in range(len(index))]
+        out = bytearray(raw[:spans[0][0]])
+        for (i, (start, end)) in enumerate(spans):
+            out += raw[start:end]
+            if i % 10 == 9:
+                out += raw[spans[i - 1][0]:end]
+        out += raw[spans[-1][1]:]
+        data = data[:11] + struct.pack('>l', len(out)) + bytes(out) + data[15 + length:]
+
+        game = Game(io.BytesIO(data))
+        skipped = Game(io.BytesIO(data), rollback_history=True)
+        self.assertEqual([f.index for f in skipped.frames], [f.index for f in game.frames])
+        self.assertEqual(skipped.frames[-1].ports[0].leader.post.position, game.frames[-1].ports[0].leader.post.position)
+        self.assertEqual(len(skipped.rollbacks), 3 * 2 * (len(spans) // 10))
+        self.assertEqual(list(skipped.rollbacks[0:6:3]), [-123 + 8, -123 + 9])
+        self.assertIsNone(Game(io.BytesIO(data), skip_rollbacks=True).rollbacks)
+
+        stats = ParseStats()
+        Game(io.BytesIO(data), skip_rollbacks=True, parse_stats=stats)
+        self.assertEqual(stats.rollbacks, 2 * (len(spans) // 10))
+
+    def test_parse_rollback_and_gap(self):
+        # re-send frame 5 in place of frame 8: the batch spans as many frame numbers as it has frames
+        with open(path('v3.14.0'), 'rb') as f:
+            data = f.read()
+        (length,) = struct.unpack_from('>l', data, 11)
+        raw = data[15:15 + length]
+        index = FrameIndex.build(path('v3.14.0'))
+        spans = [(index.frames[2 * i], index.frames[2 * i + 1]) for i in range(len(index))]
+        out = bytearray(raw[:spans[0][0]])
+        for (i, (start, end)) in enumerate(spans):
+            (start, end) = spans[i - 3] if i == 123 + 8 else (start, end)
+            out += raw[start:end]
+        out += raw[spans[-1][1]:]
+        data = data[:11] + struct.pack('>l', len(out)) + bytes(out) + data[15 + length:]
+
+        with self.assertRaises(ParseError) as cm:
+            Game(io.BytesIO(data))
+        self.assertIn('missing frames', cm.exception.args[0])
+
+    def test_parse_bookends(self):
+        # 3.0.0+ frames are complete at their bookend, so the last one comes before the game end
+        for event_types in (None, {EventType.GAME_END, EventType.FRAME_PRE, EventType.FRAME_POST}):
+            events = [e for (e, _) in iter_events(path('v3.14.0'), (ParseEvent.FRAME, ParseEvent.END), event_types=event_types)]
+            self.assertEqual(events[-2:], [ParseEvent.FRAME, ParseEvent.END])
+
+        events = [e for (e, _) in iter_events(path('v2.0'), (ParseEvent.FRAME, ParseEvent.END))]
+        self.assertEqual(events[-2:], [ParseEvent.END, ParseEvent.FRAME])
+
+    def test_parse_follow(self):
+        for name in ('v3.14.0', 'v2.0'):
+            with open(path(name), 'rb') as f:
+                data = f.read()
+            data = data[:11] + b'\0\0\0\0' + data[15:] # in-progress replays don't have a length yet
+            game = Game(path(name))
+
+            with tempfile.TemporaryDirectory() as tmp:
+                live = os.path.join(tmp, 'live.slp')
+                open(live, 'wb').close()
+
+                def write():
+                    with open(live, 'ab') as f:
+                        for i in range(0, len(data), 50000):
+                            f.write(data[i:i + 50000])
+                            f.flush()
+                            time.sleep(0.001)
+
+                writer = threading.Thread(target=write)
+                writer.start()
+                frames = []
+                metadata = []
+                parse(live, {ParseEvent.FRAME: frames.append, ParseEvent.METADATA: metadata.append}, follow=Follow(timeout=10))
+                writer.join()
+
+            self.assertEqual([f.index for f in frames], [f.index for f in game.frames])
+            self.assertEqual(frames[-1].ports[0].leader.post.position, game.frames[-1].ports[0].leader.post.position)
+            self.assertEqual(metadata, [game.metadata])
+
+        with open(path('v3.14.0'), 'rb') as f:
+            truncated = io.BytesIO(f.read()[:100000])
+        with self.assertRaises(ParseError):
+            list(iter_frames(truncated, follow=Follow(timeout=0.01)))
+
+    def test_iter_frames(self):
+        game = Game(path('v3.14.0'))
+        frames = list(iter_frames(path('v3.14.0')))
+        self.assertEqual([f.index for f in frames], [f.index for f in game.frames])
+        self.assertEqual(frames[-1].ports[0].leader.post.position, game.frames[-1].ports[0].leader.post.position)
+
+        with open(path('v3.14.0'), 'rb') as f:
+            first = list(itertools.islice(iter_frames(f), 10))
+        self.assertEqual([f.index for f in first], list(range(-123, -113)))
+        self.assertEqual(first[-1].ports[1].leader.pre.buttons, game.frames[9].ports[1].leader.pre.buttons)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            empty = os.path.join(tmp, 'empty.slp')
+            open(empty, 'wb').close()
+            for use_mmap in (True, False):
+                with self.assertRaises(ParseError) as cm:
+                    list(iter_frames(empty, use_mmap=use_mmap))
+                self.assertEqual(cm.exception.filename, empty)
+
+    def test_iter_events(self):
+        events = list(iter_events(path('v3.14.0')))
+        self.assertEqual(events[0][0], ParseEvent.START)
+        self.assertEqual(events[-1][0], ParseEvent.METADATA)
+        self.assertEqual(sum(e is ParseEvent.END for (e, _) in events), 1)
+        self.assertEqual(events[-1][1], Game(path('v3.14.0')).metadata)
+
+        events = list(iter_events(path('v3.14.0'), (ParseEvent.START, ParseEvent.METADATA_RAW), skip_frames=True))
+        self.assertEqual([e for (e, _) in events], [ParseEvent.START, ParseEvent.METADATA_RAW])
+
+    def test_parse_raw(self):
+        for name in ('v3.14.0', 'unknown_event'):
+            with open(path(name), 'rb') as f:
+                data = f.read()
+            (length,) = struct.unpack('>l', data[11:15])
+            events = []
+            parse(path(name), {ParseEvent.RAW: events.append})
+            self.assertEqual(b''.join(bytes([code]) + bytes(payload) for (code, payload) in events), data[15:15 + length])
+            self.assertEqual([code for (code, _) in events[:2]], [EventType.EVENT_PAYLOADS.value, EventType.GAME_START.value])
+        self.assertIn(0xff, [code for (code, _) in events]) # an unknown event type
+
+        # framing alone doesn't need the metadata, so a corrupt metadata tail doesn't matter
+        with open(path('v3.14.0'), 'rb') as f:
+            data = f.read()
+        (length,) = struct.unpack('>l', data[11:15])
+        corrupt = data[:15 + length] + b'\xff' * (len(data) - 15 - length)
+        events = []
+        parse(io.BytesIO(corrupt), {ParseEvent.RAW: events.append})
+        self.assertEqual(b''.join(bytes([code]) + bytes(payload) for (code, payload) in events), data[15:15 + length])
+        with self.assertRaises(ParseError):
+            parse(io.BytesIO(corrupt), {ParseEvent.RAW: events.append, ParseEvent.METADATA: lambda x: None})
+
+        events = list(iter_events(path('v2.0'), (ParseEvent.RAW, ParseEvent.START, ParseEvent.END)))
+        self.assertEqual([e for (e, _) in events[1:3]], [ParseEvent.RAW, ParseEvent.START])
+        self.assertEqual([e for (e, _) in events[-2:]], [ParseEvent.RAW, ParseEvent.END])
+
+        with open(path('v2.0'), 'rb') as f:
+            data = f.read()
+        with ReplayServer(path('v2.0'), fps=20000) as server:
+            streamed = b''.join(bytes([code]) + bytes(payload) for (_, (code, payload)) in iter_stream(server.address, (ParseEvent.RAW,)))
+        (length,) = struct.unpack('>l', data[11:15])
+        self.assertEqual(streamed, data[15:15 + length])
+
+    def test_peek(self):
+        for name in ('v3.14.0', 'v2.0', 'v0.1', 'netplay'):
+            game = Game(path(name), skip_frames=True)
+            peeked = peek(path(name))
+            self.assertEqual(peeked.start, game.start)
+            self.assertEqual(peeked.end, game.end)
+            self.assertEqual(peeked.metadata, game.metadata)
+            self.assertEqual(peeked.metadata_raw, game.metadata_raw)
+
+        with open(path('v3.14.0'), 'rb') as f:
+            data = f.read()
+        reads = []
+        class Counted(io.BytesIO):
+            def read(self, size = -1):
+                reads.append(size)
+                return super().read(size)
+        game = Game(path('v3.14.0'), skip_frames=True)
+        self.assertEqual(peek(Counted(data)).end, game.end)
+        self.assertEqual(len(reads), 2)
+
+        in_progress = peek(io.BytesIO(data[:11] + b'\0\0\0\0' + data[15:100000]))
+        self.assertEqual(in_progress.start, game.start)
+        self.assertIsNone(in_progress.end)
+        self.assertIsNone(in_progress.metadata)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, '2023-01'))
+            for (name, contents) in (('a.slp', data), (os.path.join('2023-01', 'b.slp'), data), ('c.slp', data[:1000])):
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(contents)
+            results = list(peek_dir(tmp))
+            self.assertEqual([os.path.relpath(p, tmp) for (p, _) in results], [os.path.join('2023-01', 'b.slp'), 'a.slp', 'c.slp'])
+            self.assertEqual(results[0][1].metadata, results[1][1].metadata)
+            self.assertIsInstance(results[2][1], ParseError)
+            self.assertEqual(len(list(peek_dir(tmp, recursive=False))), 2)
+
+            missing = os.path.join(tmp, 'missing.slp')
+            with self.assertRaises(ParseError) as cm:
+                peek(missing)
+            self.assertEqual(cm.exception.filename, missing)
+            self.assertIsInstance(cm.exception.__cause__, FileNotFoundError)
+            # stopping early only waits for the few reads that were ahead of the caller
+            consumed = []
+            def paths():
+                for i in range(100):
+                    consumed.append(i)
+                    yield os.path.join(tmp, 'a.slp')
+            results = peek_dir(paths(), workers=2)
+            self.assertEqual(next(results)[1].end, game.end)
+            results.close()
+            self.assertLessEqual(len(consumed), 5)
+
+            results = list(peek_dir([missing, os.path.join(tmp, 'a.slp')]))
+            self.assertIsInstance(results[0][1], ParseError)
+            self.assertEqual(results[1][1].end, game.end)
+
+    def test_parse_file_object(self):
+        game = Game(path('v3.14.0'))
+        with open(path('v3.14.0'), 'rb') as f:
+            from_file = Game(f)
+        self.assertEqual(from_file.start, game.start)
+        self.assertEqual(len(from_file.frames), len(game.frames))
+        self.assertEqual(from_file.frames[-1].ports[0].leader.post.position, game.frames[-1].ports[0].leader.post.position)
+
+    def test_parse_mmap(self):
+        game = Game(path('v3.14.0'))
+        mapped = Game(path('v3.14.0'), use_mmap=True)
+        self.assertEqual(mapped.start, game.start)
+        self.assertEqual(mapped.metadata, game.metadata)
+        self.assertEqual(len(mapped.frames), len(game.frames))
+        self.assertEqual(mapped.frames[-1].ports[1].leader.pre.buttons, game.frames[-1].ports[1].leader.pre.buttons)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            empty = os.path.join(tmp, 'empty.slp')
+            open(empty, 'wb').close()
+            for kwargs in ({}, {'use_mmap': True}, {'frame_range': (0, 10)}):
+                with self.assertRaises(ParseError) as cm:
+                    Game(empty, **kwargs)
+                self.assertEqual(cm.exception.filename, empty)
+
+    def test_slots(self):
+        game = Game(path('items'))
+        frame = next(f for f in game.frames if f.items)
+        for obj in (game.start, game.start.players[0], game.end, frame, frame.ports[0], frame.ports[0].leader,
+                    frame.ports[0].leader.pre, frame.ports[0].leader.post, frame.items[0], frame.start, frame.end,
+                    frame.ports[0].leader.pre.triggers, frame.ports[0].leader.pre.buttons):
+            self.assertFalse(hasattr(obj, '__dict__'), type(obj).__qualname__)
+
+    def test_interned_controller_state(self):
+        game = Game(path('v3.14.0'))
+        (first, last) = (game.frames[0].ports[0].leader.pre, game.frames[1].ports[0].leader.pre)
+        self.assertEqual(first.buttons, last.buttons)
+        self.assertIs(first.buttons, last.buttons)
+        self.assertIs(first.triggers, last.triggers)
+        self.assertIs(first.joystick, last.joystick)
+
+    def test_interned_immutable(self):
+        pre = Game(path('v3.14.0')).frames[0].ports[0].leader.pre
+        for (obj, attr) in ((pre.joystick, 'x'), (pre.cstick, 'y'), (pre.triggers, 'logical'), (pre.triggers.physical, 'l'),
+                            (pre.buttons, 'physical')):
+            with self.assertRaises(AttributeError):
+                setattr(obj, attr, 1)
+        # interned objects are shared with other games, so they must come back out of a pickle as equal copies
+        for obj in (pre.joystick, pre.triggers, pre.buttons):
+            self.assertEqual(pickle.loads(pickle.dumps(obj)), obj)
+
+    def test_pickle_lazy_frames(self):
+        game = Game(path('v3.14.0'), use_mmap=True)
+        loaded = pickle.loads(pickle.dumps(game))
+        self.assertIsInstance(loaded.frames[-1].ports[0].leader._post, int)
+        self.assertIs(loaded.frames[0].ports[0].leader._source, loaded.frames[-1].ports[1].leader._source)
+        self.assertEqual(loaded.frames[-1].ports[0].leader.post.position, game.frames[-1].ports[0].leader.post.position)
+
+
+class TestStream(unittest.TestCase):
+    def test_stream(self):
+        games = [Game(path('v3.14.0')), Game(path('v2.0'))]
+        with ReplayServer([path('v3.14.0'), path('v2.0')], fps=None) as server:
+            events = list(iter_stream(server.address))
+        self.assertEqual([x for (e, x) in events if e is ParseEvent.START], [g.start for g in games])
+        self.assertEqual(sum(e is ParseEvent.END for (e, _) in events), 2)
+        frames = [x for (e, x) in events if e is ParseEvent.FRAME]
+        self.assertEqual([f.index for f in frames], [f.index for g in games for f in g.frames])
+        self.assertEqual(frames[-1].ports[0].leader.post.position, games[1].frames[-1].ports[0].leader.post.position)
+
+    def test_stream_paced(self):
+        game = Game(path('v2.0'))
+        with ReplayServer(path('v2.0'), fps=50000) as server:
+            batches = [x for (_, x) in iter_stream(server.address, (ParseEvent.FRAME_BATCH,))]
+        self.assertGreater(len(batches), 1)
+        self.assertEqual([f.index for b in batches for f in b], [f.index for f in game.frames])
+
+    def test_stream_reconnect(self):
+        game = Game(path('v3.14.0'))
+        frames = []
+        with ReplayServer(path('v3.14.0'), fps=None, drop_after=300000) as server:
+            parse_stream(server.address, {ParseEvent.FRAME: frames.append}, reconnect=Reconnect(interval=0.01))
+        self.assertEqual([f.index for f in frames], [f.index for f in game.frames])
+        self.assertEqual(frames[-1].ports[1].leader.pre.buttons, game.frames[-1].ports[1].leader.pre.buttons)
+
+        with ReplayServer(path('v3.14.0'), fps=None, drop_after=300000) as server:
+            with self.assertRaises(ParseError):
+                parse_stream(server.address, {ParseEvent.FRAME: frames.append})
+
+    def test_stream_reconnect_different_game(self):
+        chunks = []
+        for name in ('v3.14.0', 'v2.0'):
+            with open(path(name), 'rb') as f:
+                data = f.read()
+            (length,) = struct.unpack('>l', data[11:15])
+            chunks.append(data[15:15 + length]) # just the events, as a stream sends them
+        # the stream drops mid-game, and what's sent on reconnecting is a different game
+        connections = itertools.chain([io.BytesIO(chunks[0][:50000])], iter(lambda: io.BytesIO(chunks[1]), None))
+        with self.assertRaises(ParseError) as cm:
+            list(iter_stream(lambda: next(connections), reconnect=Reconnect(interval=0.01, timeout=1)))
+        self.assertEqual(cm.exception.args[0], 'reconnected to a different game')
+
+
+class TestRelay(unittest.TestCase):
+    def _frames(self, source, **kwargs):
+        return [f.index for (_, f) in iter_stream(source, (ParseEvent.FRAME,), **kwargs)]
+
+    def test_relay(self):
+        games = [Game(path('v3.14.0')), Game(path('v2.0'))]
+        with ReplayServer([path('v3.14.0'), path('v2.0')], fps=None) as server:
+            relay = Relay(server.address, overflow=Overflow.BLOCK)
+            subscriptions = [relay.subscribe() for _ in range(3)]
+            with relay:
+                results = [None] * len(subscriptions)
+                def read(i):
+                    results[i] = self._frames(subscriptions[i])
+                threads = [threading.Thread(target=read, args=(i,)) for i in range(len(subscriptions))]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        self.assertIsNone(relay.error)
+        for frames in results:
+            self.assertEqual(frames, [f.index for g in games for f in g.frames])
+
+    def test_relay_late(self):
+        game = Game(path('v2.0'))
+        with ReplayServer(path('v2.0'), fps=20000) as server, Relay(server.address, overflow=Overflow.BLOCK) as relay:
+            time.sleep(0.2)
+            self.assertEqual(self._frames(relay.subscribe()), [f.index for f in game.frames])
+
+        # a finished replay file, as the source: once its game has ended, there's nothing to catch up on
+        relay = Relay(path('ics'), overflow=Overflow.BLOCK)
+        early = relay.subscribe()
+        with relay:
+            relay.join()
+            self.assertEqual(self._frames(relay.subscribe()), [])
+            self.assertEqual(self._frames(early), [f.index for f in Game(path('ics')).frames])
+
+    def test_relay_close(self):
+        with open(path('v2.0'), 'rb') as f:
+            data = f.read()
+        with tempfile.TemporaryDirectory() as d:
+            live = os.path.join(d, 'live.slp')
+            with open(live, 'wb') as f:
+                f.write(data[:11] + b'\0\0\0\0' + data[15:100000])
+
+            # a connection that's waiting for the next frame, and a replay file that isn't being written to
+            with ReplayServer(path('v2.0'), fps=60) as server:
+                for source in (server.address, live):
+                    relay = Relay(source, follow=Follow(timeout=60)).start()
+                    subscription = relay.subscribe()
+                    time.sleep(0.2)
+                    started = time.monotonic()
+                    relay.close()
+                    self.assertLess(time.monotonic() - started, 1)
+                    self.assertFalse(relay._thread.is_alive())
+                    self.assertIsNone(relay.error)
+                    self.assertEqual(subscription.read(), b'')
+
+    def test_relay_overflow(self):
+        game = Game(path('v2.0'))
+        with ReplayServer(path('v2.0'), fps=None) as server, Relay(server.address, queue_size=100) as relay:
+            subscription = relay.subscribe()
+            relay.join()
+            events = list(iter_stream(subscription))
+        frames = [f.index for (e, f) in events if e is ParseEvent.FRAME]
+        self.assertGreater(subscription.dropped, 0)
+        self.assertLessEqual(len(frames), 100)
+        self.assertEqual(frames, [f.index for f in game.frames[-len(frames):]])
+        self.assertEqual([e for (e, _) in events if e is not ParseEvent.FRAME], [ParseEvent.START, ParseEvent.END])
+
+        # a subscriber that falls behind is disconnected, and catches up when it reconnects
+        game = Game(path('ics'))
+        frames = []
+        with ReplayServer(path('ics'), fps=3000) as server:
+            with Relay(server.address, queue_size=10, overflow=Overflow.DISCONNECT) as relay:
+                for (_, frame) in iter_stream(relay.subscribe, (ParseEvent.FRAME,), reconnect=Reconnect(interval=0.01)):
+                    if not frames:
+                        time.sleep(0.05)
+                    frames.append(frame)
+        self.assertEqual([f.index for f in frames], [f.index for f in game.frames])
+
+    def test_relay_serve(self):
+        game = Game(path('v3.14.0'))
+        with ReplayServer(path('v3.14.0'), fps=None) as server:
+            with Relay(server.address, overflow=Overflow.BLOCK) as relay:
+                address = relay.serve()
+                results = [None, None]
+                def read(i):
+                    results[i] = self._frames(address)
+                threads = [threading.Thread(target=read, args=(i,)) for i in range(len(results))]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        self.assertEqual(results, [[f.index for f in game.frames]] * 2)
+
 
 if __name__ == '__main__':
     unittest.main()